@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+import argparse
+import time
+from forecasting import forecast_periods, load_history
+from forecast.backtest import (
+    ACCURACY_FILE, DEFAULT_ENGINES, ENGINES, FOLD_STEP_DAYS, FOLDS, BacktestContext,
+    accuracy_table, fold_offsets, init_backtest_worker, run_fold, save_accuracy,
+)
+from forecast.parallel import default_workers, make_pool, ordered_imap
+from forecast.regressors import RegressorTable
+from forecast.series import series_bounds
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Rolling-origin backtest of the forecasting engines.')
+    parser.add_argument('--engines', default=','.join(DEFAULT_ENGINES),
+                        help=f"comma-separated engines out of {', '.join(ENGINES)} (prophet is slow)")
+    parser.add_argument('--folds', type=int, default=FOLDS, help='number of cutoffs')
+    parser.add_argument('--step', type=int, default=FOLD_STEP_DAYS, help='days between cutoffs')
+    parser.add_argument('--workers', type=int, default=default_workers(),
+                        help='number of folds run in parallel (default: all cores but one)')
+    parser.add_argument('--output', default=ACCURACY_FILE, help='where to write the accuracy table')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    engines = args.engines.split(',')
+    unknown = set(engines) - set(ENGINES)
+    if unknown:
+        raise SystemExit(f"Unknown engine(s): {', '.join(sorted(unknown))}")
+
+    df = load_history()
+    sorted_df, starts, stops = series_bounds(df)
+    long_enough = stops - starts > forecast_periods
+    starts, stops = starts[long_enough], stops[long_enough]
+
+    offsets = fold_offsets(forecast_periods, args.folds, args.step)
+    regressor_table = RegressorTable(df, forecast_periods) if 'prophet' in engines else None
+    context = BacktestContext(sorted_df, starts, stops, forecast_periods, offsets, engines, regressor_table)
+    print(f"Backtesting {', '.join(engines)} on {len(starts)} series over {len(offsets)} folds")
+
+    start_time = time.perf_counter()
+    workers = min(args.workers, len(offsets))
+    with make_pool(workers, init_backtest_worker, (context,)) as pool:
+        fold_forecasts = list(ordered_imap(pool, run_fold, offsets, window=2 * workers))
+    print(f"Folds done in {time.perf_counter() - start_time:.1f}s")
+
+    table = accuracy_table(context, offsets, fold_forecasts)
+    save_accuracy(table, args.output)
+    summary = table.groupby('engine', observed=True).agg(
+        mae=('mae', 'mean'), median_mase=('mase', 'median'), bias=('bias', 'mean'),
+    )
+    print(summary.sort_values('median_mase').to_string(float_format='{:.3f}'.format))
+    print(f"Accuracy table saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,9 @@
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from preprocessing import DataPreprocessor
+from sales_store import SALES_DATASET, SALES_KEYS, append_partitions, migrate_legacy_file, partition_dates, read_sales_data, sum_by_key, upsert_partitions
+from ingestion_state import INGESTION_STATE_FILE, advance_high_water_mark, load_ingestion_state, save_ingestion_state
+import datetime
 import os
 import logging
 import dotenv
@@ -19,63 +22,204 @@ database_name = os.getenv('DB_NAME')
 # Create the connection string
 engine = create_engine(f'mysql+pymysql://{username}:{password}@{host}/{database_name}')
 
-# Define the output file path
-output_file = 'data/actual_sales_data.parquet'
+# Define the output dataset path (one partition per day, see sales_store.py)
+output_dataset = SALES_DATASET
+
+# Rows per chunk when streaming the full history from the database
+chunk_size = int(os.getenv('INGEST_CHUNK_SIZE', 50000))
+
+# Newest partitions re-preprocessed on every incremental run. The weather archive lags a
+# few days behind, so these rows were filled with mean temperatures and get the real
+# values once they are published.
+weather_refresh_days = int(os.getenv('WEATHER_REFRESH_DAYS', 7))
+
+# Minutes the changed-groups query reaches back behind the high-water marks. A row can
+# commit after a run that already read newer rows (concurrent POS inserts); re-reading
+# its groups is harmless, since the upsert replaces them.
+high_water_lag_minutes = int(os.getenv('HIGH_WATER_LAG_MINUTES', 10))
+
+# Daily totals per item and warehouse. Cancelled rows (docstatus = 2) count as zero so a
+# cancellation shows up as a changed group instead of silently staying in the history.
+# The MAX(creation)/MAX(modified) columns feed the high-water marks and are not stored.
+full_query = """
+    SELECT DATE(creation) as date, item_group, item_name, warehouse,
+           SUM(CASE WHEN docstatus = 2 THEN 0 ELSE qty END) AS qty_sold,
+           MAX(creation) AS max_creation, MAX(modified) AS max_modified
+    FROM `tabPOS Invoice Item`
+    GROUP BY DATE(creation), item_group, item_name, warehouse
+    ORDER BY DATE(creation) ASC, item_name ASC
+"""
+
+# Date span of the whole history, for fetching its temperatures before the full stream
+history_range_query = """
+    SELECT MIN(DATE(creation)) AS start_date, MAX(DATE(creation)) AS end_date
+    FROM `tabPOS Invoice Item`
+"""
+
+# Same totals, recomputed only for the (date, item) groups that have a row created or
+# modified since the high-water marks less high_water_lag_minutes. Every warehouse of a
+# changed item and day is re-read, since several warehouses may add up to one branch.
+# Edited and cancelled invoices from any day are picked up this way, not just those
+# inside a fixed look-back window. The changed groups are the UNION of one range
+# condition per timestamp (an OR of the two could not use either index), and their rows
+# are matched by a creation range rather than DATE(i.creation), so no function is
+# evaluated on every row of the table.
+changed_query = """
+    SELECT DATE(i.creation) as date, i.item_group, i.item_name, i.warehouse,
+           SUM(CASE WHEN i.docstatus = 2 THEN 0 ELSE i.qty END) AS qty_sold,
+           MAX(i.creation) AS max_creation, MAX(i.modified) AS max_modified
+    FROM (
+        SELECT DATE(creation) AS date, item_name
+        FROM `tabPOS Invoice Item`
+        WHERE creation >= '{creation}' - INTERVAL {lag} MINUTE
+        UNION
+        SELECT DATE(creation) AS date, item_name
+        FROM `tabPOS Invoice Item`
+        WHERE modified >= '{modified}' - INTERVAL {lag} MINUTE
+    ) changed
+    JOIN `tabPOS Invoice Item` i
+      ON i.creation >= changed.date
+     AND i.creation < changed.date + INTERVAL 1 DAY
+     AND i.item_name = changed.item_name
+    GROUP BY DATE(i.creation), i.item_group, i.item_name, i.warehouse
+    ORDER BY DATE(i.creation) ASC
+"""
+
+# Columns returned by the queries that are only used for bookkeeping
+watermark_columns = ['max_creation', 'max_modified']
 
 def fetch_data(query, engine):
     """Fetch data based on a SQL query from the database."""
     logging.info(f"Executing query: {query}")
     return pd.read_sql(query, engine)
 
-def retrieve_and_update_data(engine, output_file):
-    # Determine if there's existing data and set the query accordingly
-    if os.path.exists(output_file):
-        existing_df = pd.read_parquet(output_file)
-        max_date = existing_df['date'].max()  # Get the max date in the existing data
-        logging.info(f"Max date in existing file: {max_date}")
-
-        # Query to retrieve records from one day before the max_date
-        query = f"""
-            SELECT DATE(creation) as date, item_group, item_name, warehouse, SUM(qty) AS qty_sold
-            FROM `tabPOS Invoice Item`
-            WHERE DATE(creation) >= DATE_SUB('{max_date}', INTERVAL 1 DAY)
-            GROUP BY DATE(creation), item_group, item_name, warehouse
-            ORDER BY DATE(creation) ASC
-        """
-    else:
-        logging.info("No existing file found. Fetching all data from the database.")
-        # Query to retrieve all records if no local file exists
-        query = """
-            SELECT DATE(creation) as date, item_group, item_name, warehouse, SUM(qty) AS qty_sold
-            FROM `tabPOS Invoice Item`
-            GROUP BY DATE(creation), item_group, item_name, warehouse
-            ORDER BY DATE(creation) ASC
-        """
-
-    # Fetch new data from the database
-    new_data = fetch_data(query, engine)
-
-    if not new_data.empty:
-        # Rename columns and prepare data for merging
-        new_data.rename(columns={'warehouse': 'branch'}, inplace=True)
-
-        # Combine new data with existing data, if any, and remove duplicates
-        if os.path.exists(output_file):
-            combined_df = pd.concat([existing_df, new_data]).drop_duplicates(subset=['date', 'item_name', 'branch'], keep='last')
-        else:
-            combined_df = new_data
+def fetch_data_batches(query, engine, chunk_size):
+    """Stream the result of a SQL query as DataFrames of at most chunk_size rows."""
+    logging.info(f"Streaming query in chunks of {chunk_size} rows: {query}")
+    # stream_results makes pymysql use a server-side (unbuffered) cursor
+    with engine.connect().execution_options(stream_results=True, max_row_buffer=chunk_size) as connection:
+        result = connection.execute(text(query))
+        columns = list(result.keys())
+        for rows in result.partitions(chunk_size):
+            yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+def stream_to_dataset(query, engine, output_dataset, preprocessor, chunk_size):
+    """Fetch, preprocess and write one chunk at a time so memory is bounded by chunk_size.
 
-        # Initialize and use DataPreprocessor to preprocess the combined data
-        preprocessor = DataPreprocessor()
-        combined_df = preprocessor.preprocess(combined_df)
+    Returns the number of rows written and the max creation/modified timestamps seen.
+    """
+    total_rows = 0
+    chunk_creation, chunk_modified = [], []
 
-        # Save the updated combined data back to the Parquet file
-        combined_df.to_parquet(output_file, engine='pyarrow', index=False)
-        logging.info(f"Updated data saved to {output_file}")
+    def write_chunk(chunk, batch_id):
+        nonlocal total_rows
+        chunk = preprocessor.preprocess(sum_by_key(chunk))
+        append_partitions(chunk, output_dataset, batch_id=batch_id)
+        total_rows += len(chunk)
+        logging.info(f"Wrote chunk {batch_id} ({len(chunk)} rows, {total_rows} total) to {output_dataset}")
+
+    held_back = None
+    batch_id = -1
+    for batch_id, chunk in enumerate(fetch_data_batches(query, engine, chunk_size)):
+        chunk_creation.append(pd.to_datetime(chunk['max_creation']).max())
+        chunk_modified.append(pd.to_datetime(chunk['max_modified']).max())
+        chunk = chunk.drop(columns=watermark_columns)
+        chunk.rename(columns={'warehouse': 'branch'}, inplace=True)
+        chunk = preprocessor.replace_branch_names(chunk)
+        if held_back is not None:
+            chunk = pd.concat([held_back, chunk], ignore_index=True)
+        # Rows come ordered by date and item; the last (date, item) may go on in the next
+        # chunk, so it is held back until all its warehouses can be added up together
+        last = (chunk['date'] == chunk['date'].iloc[-1]) & (chunk['item_name'] == chunk['item_name'].iloc[-1])
+        held_back = chunk[last]
+        if not last.all():
+            write_chunk(chunk[~last], batch_id)
+    if held_back is not None:
+        write_chunk(held_back, batch_id + 1)
+    return total_rows, pd.Series(chunk_creation, dtype='datetime64[ns]').max(), pd.Series(chunk_modified, dtype='datetime64[ns]').max()
+
+def retrieve_and_update_data(engine, output_dataset, state_file=INGESTION_STATE_FILE):
+    started_at = datetime.datetime.now()
+    # Convert the old single-file history the first time the partitioned layout is used
+    migrate_legacy_file(dataset=output_dataset)
+
+    state = load_ingestion_state(state_file)
+    marks = state['high_water_mark']
+    preprocessor = DataPreprocessor(temperature_stats=state.get('temperature_stats'))
+    existing_dates = partition_dates(output_dataset)
+
+    if not existing_dates:
+        logging.info("No existing data found. Streaming all data from the database.")
+        # MySQL drops a server-side cursor that waits longer than net_write_timeout, so the
+        # weather archive is not asked while it is open: the temperatures of the whole
+        # history are fetched first and every chunk is served from the cache
+        history_range = fetch_data(history_range_query, engine).iloc[0]
+        if pd.notna(history_range['start_date']):
+            preprocessor.warm_weather_cache(history_range['start_date'], history_range['end_date'])
+        offline = preprocessor.weather_cache.offline
+        preprocessor.weather_cache.offline = True
+        # The full history is never held in memory; chunks go straight to the dataset
+        rows_fetched, max_creation, max_modified = stream_to_dataset(
+            full_query, engine, output_dataset, preprocessor, chunk_size
+        )
+        preprocessor.weather_cache.offline = offline
+        mode = 'full'
+        rows_preprocessed = rows_fetched
+        partitions_written = len(partition_dates(output_dataset))
     else:
-        logging.info("No new data to update.")
+        if marks.get('modified') is None:
+            # Data from before the state file existed: start one day before the newest partition
+            start = str(existing_dates[-1] - pd.Timedelta(days=1))
+            marks = {'creation': start, 'modified': start}
+            logging.info(f"No ingestion state found, starting from {start}")
+        logging.info(f"High-water marks: creation={marks['creation']}, modified={marks['modified']}")
+
+        # Fetch only the groups that changed since the last run
+        new_data = fetch_data(changed_query.format(**marks, lag=high_water_lag_minutes), engine)
+        rows_fetched = len(new_data)
+        mode = 'incremental'
+        max_creation = new_data['max_creation'].max() if rows_fetched else None
+        max_modified = new_data['max_modified'].max() if rows_fetched else None
+
+        rows_preprocessed = partitions_written = 0
+        if not new_data.empty:
+            # Rename columns and prepare data for merging
+            new_data = new_data.drop(columns=watermark_columns)
+            new_data.rename(columns={'warehouse': 'branch'}, inplace=True)
+            new_data['date'] = pd.to_datetime(new_data['date'])
+            # Stored rows carry simplified branch names, map the new rows so the keys line up
+            new_data = preprocessor.replace_branch_names(new_data)
+            # Warehouses that map to the same branch are added up, not deduplicated
+            new_data = sum_by_key(new_data)
+
+            # Only the delta and the weather refresh window are preprocessed, never the whole history
+            refresh_df = read_sales_data(output_dataset, dates=existing_dates[-weather_refresh_days:])
+            delta_df = pd.concat([refresh_df, new_data]).drop_duplicates(subset=SALES_KEYS, keep='last')
+            delta_df = preprocessor.preprocess(delta_df)
+            rows_preprocessed = len(delta_df)
+
+            # Merge the preprocessed slice into the store by (date, item_name, branch)
+            upsert_partitions(delta_df, output_dataset)
+            partitions_written = delta_df['date'].nunique()
+            logging.info(f"Updated data saved to {output_dataset}")
+        else:
+            logging.info("No new data to update.")
 
+    state['high_water_mark'] = marks
+    advance_high_water_mark(state, max_creation, max_modified)
+    state['temperature_stats'] = preprocessor.temperature_stats
+    state['last_run'] = {
+        'mode': mode,
+        'started_at': str(started_at),
+        'finished_at': str(datetime.datetime.now()),
+        'rows_fetched': int(rows_fetched),
+        'rows_preprocessed': int(rows_preprocessed),
+        'partitions_written': int(partitions_written),
+    }
+    save_ingestion_state(state, state_file)
+    if preprocessor.recorder.stages:
+        preprocessor.recorder.write()
     logging.info("Data ingestion pipeline completed successfully.")
 
 # Call the function
-retrieve_and_update_data(engine, output_file)
+retrieve_and_update_data(engine, output_dataset)
@@ -0,0 +1,153 @@
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from forecast.fast_engines import (
+    FAST_LOOKBACK_DAYS, FAST_MODELS, INTERMITTENT_MODELS, fill_missing, mase_scale, select_engines,
+)
+from forecast.fingerprints import series_key
+from forecast.global_model import global_forecast, global_inputs
+from forecast.series import series_panel
+from forecast import prophet_engine
+
+BACKTEST_DIR = 'data/backtest'
+ACCURACY_FILE = os.path.join(BACKTEST_DIR, 'accuracy.parquet')
+FOLDS = 8
+FOLD_STEP_DAYS = 7
+# Every engine that can be backtested; 'fast' is the fast tier as in production and
+# 'fast_pick' the per-series pick among the fast and intermittent-demand models
+BATCH_MODELS = {**FAST_MODELS, **INTERMITTENT_MODELS}
+ENGINES = list(BATCH_MODELS) + ['fast', 'fast_pick', 'global', 'prophet']
+DEFAULT_ENGINES = list(BATCH_MODELS) + ['fast', 'fast_pick', 'global']
+
+# Read-only inputs of a fold worker, set once by init_backtest_worker
+_context = None
+
+
+def fold_offsets(horizon, folds=FOLDS, step=FOLD_STEP_DAYS):
+    """Days between each fold's cutoff and the end of every series, newest fold first."""
+    return [horizon + step * fold for fold in range(folds)]
+
+
+class BacktestContext:
+    """Everything the folds share: the long sales panel and the inputs of each engine.
+
+    The panel holds ``FAST_LOOKBACK_DAYS`` of training history for the oldest fold plus
+    all the later days, right-aligned on each series' last date. A fold with offset
+    ``c`` trains on the ``FAST_LOOKBACK_DAYS`` columns before ``window - c`` and is
+    scored on the ``horizon`` columns from there, as in production.
+    """
+
+    def __init__(self, sorted_df, starts, stops, horizon, offsets, engines, regressor_table=None):
+        self.sorted_df, self.starts, self.stops = sorted_df, starts, stops
+        self.horizon = horizon
+        self.window = FAST_LOOKBACK_DAYS + max(offsets)
+        self.panel, self.last_dates = series_panel(sorted_df, starts, stops, self.window)
+        self.engines = engines
+        if 'global' in engines:
+            self.temperatures, self.codes = global_inputs(sorted_df, starts, stops, self.window)
+        self.regressor_table = regressor_table
+
+    def train_columns(self, offset):
+        return slice(self.window - offset - FAST_LOOKBACK_DAYS, self.window - offset)
+
+    def test_columns(self, offset):
+        return slice(self.window - offset, self.window - offset + self.horizon)
+
+
+def init_backtest_worker(context):
+    """Pool initializer: keep the backtest context in the worker."""
+    global _context
+    _context = context
+    if 'prophet' in context.engines:
+        prophet_engine.init_worker(context.regressor_table, None)
+
+
+def _prophet_fold(context, offset):
+    """Prophet forecasts of one fold, fitting every series on its rows up to the cutoff."""
+    forecasts = np.full((len(context.starts), context.horizon), np.nan)
+    for position, (start, stop) in enumerate(zip(context.starts, context.stops)):
+        category_df = context.sorted_df.iloc[start:stop]
+        cutoff = pd.Timestamp(context.last_dates[position]) - pd.Timedelta(days=offset)
+        train = category_df[category_df['date'] <= cutoff].set_index('date')
+        warehouse, category = category_df['branch'].iloc[0], category_df['item_name'].iloc[0]
+        future_dates = pd.date_range(cutoff + pd.Timedelta(days=1), periods=context.horizon, freq='D')
+        values = prophet_engine.fit_predict(train, warehouse, series_key(warehouse, category), future_dates)
+        if values is not None:
+            forecasts[position] = values['yhat'].to_numpy()
+    return forecasts
+
+
+def run_fold(offset):
+    """Forecast one fold with every engine; returns ``{engine: (series, horizon) forecasts}``."""
+    context = _context
+    train = context.panel[:, context.train_columns(offset)]
+    forecasts = {}
+    for engine in context.engines:
+        if engine in BATCH_MODELS:
+            forecasts[engine] = fill_missing(BATCH_MODELS[engine](train, context.horizon), train)
+        elif engine == 'fast':
+            forecasts[engine] = select_engines(train, None, context.horizon, 'fast')[1]
+        elif engine == 'fast_pick':
+            forecasts[engine] = select_engines(train, None, context.horizon, 'fast', pick=True)[1]
+        elif engine == 'global':
+            temperatures = [temperature[:, context.train_columns(offset)] for temperature in context.temperatures]
+            last_dates = context.last_dates - np.timedelta64(offset, 'D')
+            forecasts[engine] = global_forecast(train, temperatures, context.codes, last_dates, context.horizon)
+        elif engine == 'prophet':
+            forecasts[engine] = _prophet_fold(context, offset)
+    return forecasts
+
+
+def accuracy_table(context, offsets, fold_forecasts):
+    """Per-series accuracy of every engine over all folds, computed as whole arrays.
+
+    Forecasts are clipped at zero, as published. MAE and bias (mean of forecast minus
+    actual) are taken over every observed day of every fold; MASE divides the MAE by
+    the mean of the folds' in-sample one-week-lag MAE.
+    """
+    actuals = np.stack([context.panel[:, context.test_columns(offset)] for offset in offsets])
+    scales = np.stack([mase_scale(context.panel[:, context.train_columns(offset)]) for offset in offsets])
+    observed = ~np.isnan(actuals)
+    first_rows = context.sorted_df.iloc[context.starts]
+
+    tables = []
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        scale = np.nanmean(scales, axis=0)
+        for engine in context.engines:
+            errors = np.clip(np.stack([forecasts[engine] for forecasts in fold_forecasts]), 0, None) - actuals
+            mae = np.nanmean(np.abs(errors), axis=(0, 2))
+            tables.append(pd.DataFrame({
+                'branch': first_rows['branch'].to_numpy(),
+                'item_name': first_rows['item_name'].to_numpy(),
+                'item_group': first_rows['item_group'].to_numpy(),
+                'engine': engine,
+                'folds': observed.any(axis=2).sum(axis=0),
+                'observations': observed.sum(axis=(0, 2)),
+                'mae': mae.astype(np.float32),
+                'mase': (mae / scale).astype(np.float32),
+                'bias': np.nanmean(errors, axis=(0, 2)).astype(np.float32),
+            }))
+    table = pd.concat(tables, ignore_index=True)
+    for column in ['branch', 'item_name', 'item_group', 'engine']:
+        table[column] = table[column].astype('category')
+    return table
+
+
+def save_accuracy(table, path=ACCURACY_FILE):
+    """Write the accuracy table atomically."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    table.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def load_accuracy(path=ACCURACY_FILE, engine=None, branch=None, item_name=None):
+    """Read the accuracy table, optionally only the rows of one engine, branch or item."""
+    filters = [
+        (column, '==', value)
+        for column, value in [('engine', engine), ('branch', branch), ('item_name', item_name)]
+        if value is not None
+    ]
+    return pd.read_parquet(path, filters=filters or None)
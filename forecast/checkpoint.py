@@ -0,0 +1,62 @@
+import os
+import json
+import hashlib
+import pandas as pd
+from forecast.writer import RESULTS_DIR, clear_results
+
+RUN_DIR = 'data/forecast_run'
+MANIFEST_FILE = os.path.join(RUN_DIR, 'manifest.json')
+
+
+def run_signature(df, settings):
+    """Identify a forecasting run by its input history and settings.
+
+    A restarted run resumes only if its signature matches the interrupted one, so the
+    series positions in the stored parts still refer to the same series.
+    """
+    digest = hashlib.sha1(json.dumps(settings, sort_keys=True, default=str).encode())
+    digest.update(f"{len(df)}|{df['date'].min()}|{df['date'].max()}|{df['qty_sold'].sum()}".encode())
+    return digest.hexdigest()
+
+
+def _write_manifest(manifest, path=MANIFEST_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def start_run(signature, resume=True, path=MANIFEST_FILE, results_dir=RESULTS_DIR):
+    """Resume the unfinished run with this signature, or clear its parts and start afresh.
+
+    Returns True when the parts of an interrupted run are kept.
+    """
+    manifest = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+    if resume and manifest.get('signature') == signature and manifest.get('status') == 'running':
+        return True
+    clear_results(results_dir)
+    _write_manifest({'signature': signature, 'status': 'running', 'started': f'{pd.Timestamp.now():%Y-%m-%d %H:%M:%S}'}, path)
+    return False
+
+
+def finish_run(path=MANIFEST_FILE):
+    """Mark the run as published, so the next run starts afresh."""
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    manifest.update(status='published', finished=f'{pd.Timestamp.now():%Y-%m-%d %H:%M:%S}')
+    _write_manifest(manifest, path)
+
+
+def publish_csv(df, path):
+    """Write ``df`` as CSV next to ``path`` and rename it into place.
+
+    Readers of ``path`` see either the previous file or the complete new one, never a
+    missing or half-written file.
+    """
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
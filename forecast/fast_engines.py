@@ -0,0 +1,237 @@
+import warnings
+import numpy as np
+
+# Days of history the fast tier looks at (13 whole weeks)
+FAST_LOOKBACK_DAYS = 91
+SEASON = 7
+MA_WEEKS = 4
+SES_ALPHAS = np.array([0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9])
+
+# Intermittent demand: a series is sparse if most of its days have no sale or its
+# average interval between sales (ADI) is above the Syntetos-Boylan cut-off. Sparse
+# series are kept off Prophet but forecast with FAST_DEFAULT_MODEL like the rest;
+# Croston and TSB only run in backtests or with select_engines(pick=True)
+SPARSE_ZERO_RATIO = 0.5
+SPARSE_ADI = 1.32
+CROSTON_ALPHA = 0.1
+TSB_ALPHA = 0.1
+TSB_BETA = 0.1
+
+# A series goes to Prophet only if it has enough history and volume for Prophet's
+# seasonality and regressors to matter, and its fast-tier model fits it poorly
+PROPHET_MIN_ROWS = 120
+PROPHET_MIN_MEAN = 3.0
+PROPHET_MIN_MASE = 1.0
+# Model of every fast-tier series unless select_engines is asked to pick per series.
+# The per-series pick backtests worse than SES alone, dense and sparse series alike
+FAST_DEFAULT_MODEL = 'ses'
+
+
+def _weeks(panel):
+    """Reshape a ``(series, days)`` panel into ``(series, weeks, 7)``, dropping the oldest partial week."""
+    days = panel.shape[1] - panel.shape[1] % SEASON
+    return panel[:, panel.shape[1] - days:].reshape(panel.shape[0], -1, SEASON)
+
+
+def _season_steps(values, horizon):
+    """Repeat one value per position in the week over ``horizon`` days."""
+    return values[:, np.arange(horizon) % SEASON]
+
+
+def seasonal_naive(panel, horizon):
+    """Forecast each day with the last observed value of the same day of the week."""
+    weeks = _weeks(panel)
+    observed = ~np.isnan(weeks)
+    # Index of the latest observed week for every (series, day of week)
+    latest = np.where(observed, np.arange(weeks.shape[1])[None, :, None], 0).max(axis=1)
+    last_values = np.take_along_axis(weeks, latest[:, None, :], axis=1)[:, 0, :]
+    return _season_steps(last_values, horizon)
+
+
+def weekday_moving_average(panel, horizon, weeks=MA_WEEKS):
+    """Forecast each day with the mean of the same day of the week over the last ``weeks`` weeks."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN weekdays
+        means = np.nanmean(_weeks(panel)[:, -weeks:, :], axis=1)
+    return _season_steps(means, horizon)
+
+
+def simple_exp_smoothing(panel, horizon, alphas=SES_ALPHAS):
+    """Flat forecast from simple exponential smoothing, with alpha picked per series.
+
+    All series and all candidate alphas are smoothed together as a ``(series, alphas)``
+    array; the alpha with the lowest one-step-ahead squared error wins. Missing days
+    leave the level unchanged.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        start = np.nanmean(panel, axis=1)
+    level = np.repeat(start[:, None], len(alphas), axis=1)
+    sse = np.zeros_like(level)
+    for t in range(panel.shape[1]):
+        y = panel[:, t, None]
+        error = np.where(np.isnan(y), 0.0, y - level)
+        sse += error ** 2
+        level += alphas * error
+    best = level[np.arange(len(level)), sse.argmin(axis=1)]
+    return np.repeat(best[:, None], horizon, axis=1)
+
+
+FAST_MODELS = {
+    'seasonal_naive': seasonal_naive,
+    'weekday_ma': weekday_moving_average,
+    'ses': simple_exp_smoothing,
+}
+
+
+def demand_stats(panel):
+    """Zero ratio and average demand interval (days per day with a sale) of every series.
+
+    Days without a row count as days without a sale.
+    """
+    demand_days = (np.nan_to_num(panel) > 0).sum(axis=1)
+    zero_ratio = 1 - demand_days / panel.shape[1]
+    adi = panel.shape[1] / np.maximum(demand_days, 1)
+    return zero_ratio, adi
+
+
+def sparse_series(panel):
+    """Boolean mask of the series to forecast with the intermittent-demand models."""
+    zero_ratio, adi = demand_stats(panel)
+    return (zero_ratio >= SPARSE_ZERO_RATIO) | (adi > SPARSE_ADI)
+
+
+def _intermittent_start(demand):
+    """Initial demand size (mean non-zero demand) and interval (ADI) of every series."""
+    nonzero = demand > 0
+    counts = nonzero.sum(axis=1)
+    size = np.where(counts > 0, demand.sum(axis=1) / np.maximum(counts, 1), 0.0)
+    interval = demand.shape[1] / np.maximum(counts, 1)
+    return size, interval.astype(np.float64), nonzero
+
+
+def croston(panel, horizon, alpha=CROSTON_ALPHA):
+    """Croston's method: smoothed demand size over smoothed interval between demands.
+
+    All series are updated together, one vectorized step per day.
+    """
+    demand = np.nan_to_num(panel)
+    size, interval, nonzero = _intermittent_start(demand)
+    since_last = np.ones(len(panel))
+    for t in range(demand.shape[1]):
+        hit = nonzero[:, t]
+        size = np.where(hit, size + alpha * (demand[:, t] - size), size)
+        interval = np.where(hit, interval + alpha * (since_last - interval), interval)
+        since_last = np.where(hit, 1, since_last + 1)
+    return np.repeat((size / interval)[:, None], horizon, axis=1)
+
+
+def tsb(panel, horizon, alpha=TSB_ALPHA, beta=TSB_BETA):
+    """Teunter-Syntetos-Babai: smoothed demand size times smoothed probability of a demand.
+
+    Unlike Croston, the probability decays on every day without demand, so series that
+    stop selling fade towards zero.
+    """
+    demand = np.nan_to_num(panel)
+    size, interval, nonzero = _intermittent_start(demand)
+    probability = 1 / interval
+    for t in range(demand.shape[1]):
+        hit = nonzero[:, t]
+        probability = probability + beta * (hit - probability)
+        size = np.where(hit, size + alpha * (demand[:, t] - size), size)
+    return np.repeat((size * probability)[:, None], horizon, axis=1)
+
+
+INTERMITTENT_MODELS = {
+    'croston': croston,
+    'tsb': tsb,
+}
+
+
+def fill_missing(forecasts, panel):
+    """Replace NaN forecasts (no recent observation) with the series mean, or 0."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        fallback = np.nan_to_num(np.nanmean(panel, axis=1))
+    return np.where(np.isnan(forecasts), fallback[:, None], forecasts)
+
+
+def mase_scale(panel):
+    """In-sample MAE of a one-week-lag forecast per series, the MASE denominator (NaN if 0)."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        scale = np.nanmean(np.abs(panel[:, SEASON:] - panel[:, :-SEASON]), axis=1)
+    scale[scale == 0] = np.nan
+    return scale
+
+
+def holdout_errors(panel, horizon, models=FAST_MODELS):
+    """Scaled holdout error of every model in ``models``, as a ``(series, models)`` array.
+
+    Each model is fitted on all but the last ``horizon`` days and scored on them. The
+    mean absolute error is divided by the in-sample MAE of a one-week-lag forecast
+    (MASE), so errors compare across series of different volume. NaN if unscorable.
+    """
+    train, test = panel[:, :-horizon], panel[:, -horizon:]
+    scale = mase_scale(train)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        errors = [
+            np.nanmean(np.abs(fill_missing(model(train, horizon), train) - test), axis=1) / scale
+            for model in models.values()
+        ]
+    return np.column_stack(errors)
+
+
+def _best_model(panel, horizon, models):
+    """Index of each series' best model by holdout error, that error, and the model's forecasts."""
+    errors = np.nan_to_num(holdout_errors(panel, horizon, models), nan=np.inf)
+    best = errors.argmin(axis=1)
+    all_forecasts = np.stack([fill_missing(model(panel, horizon), panel) for model in models.values()])
+    return best, errors.min(axis=1), all_forecasts[best, np.arange(len(best))]
+
+
+def select_engines(panel, rows, horizon, engine='auto', pick=False):
+    """Pick a model for every series and forecast the fast-tier ones.
+
+    Every series gets ``FAST_DEFAULT_MODEL``. With ``pick`` sparse series (see
+    :func:`sparse_series`) get the better of Croston and TSB by holdout error instead,
+    the others the best fast model; in backtests that pick scores worse than SES alone,
+    dense and sparse series alike, so it is off until it beats it. Returns
+    ``(model_names, forecasts, use_prophet)``: the model per series and its
+    ``(series, horizon)`` forecasts, fitted on the full panel, plus a boolean mask of
+    the series to send to Prophet. ``engine`` is 'auto' (the selection rule, which
+    never sends a sparse series to Prophet), 'fast' or 'prophet' (every series to that
+    tier).
+    """
+    sparse = sparse_series(panel)
+    if pick:
+        best, best_error, forecasts = _best_model(panel, horizon, FAST_MODELS)
+        names = np.array(list(FAST_MODELS), dtype=object)[best]
+        if sparse.any():
+            # The intermittent models run on the sparse series only
+            sparse_best, _, sparse_forecasts = _best_model(panel[sparse], horizon, INTERMITTENT_MODELS)
+            names[sparse] = np.array(list(INTERMITTENT_MODELS))[sparse_best]
+            forecasts[sparse] = sparse_forecasts
+    else:
+        # Prophet routing looks at the error of the model that is published
+        _, best_error, forecasts = _best_model(
+            panel, horizon, {FAST_DEFAULT_MODEL: FAST_MODELS[FAST_DEFAULT_MODEL]},
+        )
+        names = np.full(len(panel), FAST_DEFAULT_MODEL, dtype=object)
+
+    if engine == 'prophet':
+        use_prophet = np.ones(len(panel), dtype=bool)
+    elif engine == 'fast':
+        use_prophet = np.zeros(len(panel), dtype=bool)
+    else:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            mean_demand = np.nan_to_num(np.nanmean(panel, axis=1))
+        use_prophet = (
+            (np.asarray(rows) >= PROPHET_MIN_ROWS)
+            & (mean_demand >= PROPHET_MIN_MEAN)
+            & (best_error > PROPHET_MIN_MASE)
+            & ~sparse
+        )
+    return names.astype(str), forecasts, use_prophet
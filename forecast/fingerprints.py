@@ -0,0 +1,47 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+FINGERPRINT_FILE = 'data/forecast_state/fingerprints.json'
+
+# Everything a series' forecast is fitted on; a change in any of them means a refit
+FINGERPRINT_COLUMNS = ['date', 'qty_sold', 'is_weekend', 'temperature_2m_max', 'temperature_2m_min']
+
+
+def series_key(branch, item_name):
+    """Stable string key of a (branch, item) series, used in state files."""
+    return f'{branch}|{item_name}'
+
+
+def series_fingerprint(series_df, config=''):
+    """Summarize one series: its last date, row count and a hash of its training data.
+
+    ``config`` is folded into the hash so that changing the forecasting settings
+    (horizon, engine, parameters) also invalidates the stored forecast.
+    """
+    digest = hashlib.sha1(config.encode())
+    for col in FINGERPRINT_COLUMNS:
+        digest.update(np.ascontiguousarray(series_df[col].to_numpy()).tobytes())
+    return {
+        'last_date': f"{series_df['date'].max():%Y-%m-%d}",
+        'rows': int(len(series_df)),
+        'hash': digest.hexdigest(),
+    }
+
+
+def load_fingerprints(path=FINGERPRINT_FILE):
+    """Load the fingerprints of the last completed run, keyed by series key."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_fingerprints(fingerprints, path=FINGERPRINT_FILE):
+    """Write the fingerprints atomically."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(fingerprints, f)
+    os.replace(tmp_path, path)
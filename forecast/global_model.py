@@ -0,0 +1,134 @@
+import warnings
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import HistGradientBoostingRegressor
+from forecast.series import series_panel
+
+LAGS = [1, 2, 3, 4, 5, 6, 7, 14, 21, 28]
+ROLLING_WINDOWS = [7, 28]
+# Forecast origins per series used for training (the last days of the panel). With many
+# series fewer origins are used, keeping the training set (and fit time) flat as items
+# are added.
+TRAIN_ORIGINS = 56
+MIN_TRAIN_ORIGINS = 7
+MAX_TRAIN_ROWS = 600_000
+# Low-cardinality columns are native categorical features. HistGradientBoosting allows
+# at most 255 categories per feature, so items (whose number only grows) are encoded as
+# the mean daily sales of the item over all its series instead.
+CATEGORY_COLUMNS = ['branch', 'item_group']
+ENCODED_COLUMNS = ['item_name']
+FEATURE_NAMES = (
+    [f'lag_{lag}' for lag in LAGS]
+    + [f'mean_{window}' for window in ROLLING_WINDOWS]
+    + ['same_weekday_1w', 'same_weekday_2w', 'same_weekday_mean_4w', 'horizon', 'weekday', 'is_weekend',
+       'temperature_2m_max', 'temperature_2m_min']
+    + CATEGORY_COLUMNS
+    + [f'{column}_mean_sales' for column in ENCODED_COLUMNS]
+)
+MODEL_PARAMS = dict(loss='poisson', learning_rate=0.15, max_iter=150, random_state=0)
+
+
+def _rolling_means(panel, window):
+    """Mean of the last ``window`` observed days up to each column, ignoring NaN."""
+    observed = ~np.isnan(panel)
+    sums = np.concatenate([np.zeros((len(panel), 1)), np.cumsum(np.where(observed, panel, 0), axis=1)], axis=1)
+    counts = np.concatenate([np.zeros((len(panel), 1)), np.cumsum(observed, axis=1)], axis=1)
+    stop = np.arange(1, panel.shape[1] + 1)
+    start = np.maximum(stop - window, 0)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return (sums[:, stop] - sums[:, start]) / (counts[:, stop] - counts[:, start])
+
+
+def _features(panel, rolling, temperatures, last_dates, codes, origins, horizon):
+    """Feature matrix for days ``origin + 1 .. origin + horizon`` of every series.
+
+    Rows are ordered by series, then origin, then horizon. Lags and rolling means are
+    taken at the origin; temperatures are the mean of the 7 days up to the origin, as
+    the future weather is not known when predicting.
+    """
+    n_series, n_origins = len(panel), len(origins)
+    steps = np.arange(1, horizon + 1)
+    shape = (n_series, n_origins, horizon)
+
+    def at_origin(values):
+        return np.broadcast_to(values[:, :, None], shape)
+
+    columns = [at_origin(panel[:, origins - lag + 1]) for lag in LAGS]
+    columns += [at_origin(means[:, origins]) for means in rolling]
+    target = origins[:, None] + steps[None, :]
+    same_weekday = []
+    for weeks in (1, 2, 3, 4):
+        seasonal = target - 7 * weeks
+        same_weekday.append(np.where(seasonal >= 0, panel[:, np.maximum(seasonal, 0)], np.nan))
+    columns += same_weekday[:2]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        columns.append(np.nanmean(same_weekday, axis=0))
+    columns.append(np.broadcast_to(steps, shape))
+
+    # Weekday of each target day (1970-01-01 was a Thursday, Monday is 0)
+    days = last_dates.astype(np.int64)[:, None, None] - (panel.shape[1] - 1) + target[None, :, :]
+    weekday = (days + 3) % 7
+    columns += [weekday, weekday >= 5]
+    columns += [at_origin(temperature[:, origins]) for temperature in temperatures]
+    columns += [np.broadcast_to(code[:, None, None], shape) for code in codes]
+    return np.stack([np.asarray(column, dtype=np.float32).reshape(-1) for column in columns], axis=1)
+
+
+def global_inputs(sorted_df, starts, stops, window):
+    """Per-series inputs of the global model besides sales: temperature panels and category codes.
+
+    The temperature panels are aligned with the sales panel of the same ``window``.
+    """
+    temperatures = [
+        series_panel(sorted_df, starts, stops, window, value=column)[0]
+        for column in ['temperature_2m_max', 'temperature_2m_min']
+    ]
+    first_rows = sorted_df.iloc[starts]
+    codes = [first_rows[column].cat.codes.to_numpy().astype(np.float32) for column in CATEGORY_COLUMNS + ENCODED_COLUMNS]
+    for code in codes:
+        code[code < 0] = np.nan
+    return temperatures, codes
+
+
+def _mean_encoding(panel, codes, stop):
+    """Mean daily sales of each code's series over the panel columns before ``stop``, per series.
+
+    Only days before the first training target are used, so the encoding does not leak
+    the targets into the features.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        series_means = np.nanmean(panel[:, :stop], axis=1)
+    return pd.Series(series_means).groupby(codes).transform('mean').to_numpy(np.float32)
+
+
+def global_forecast(panel, temperatures, codes, last_dates, horizon):
+    """Fit one gradient-boosted model over all series and forecast ``horizon`` days of each.
+
+    ``panel`` and ``last_dates`` are the right-aligned sales panel of the series (see
+    :func:`forecast.series.series_panel`); ``temperatures`` and ``codes`` come from
+    :func:`global_inputs`. Training uses the last ``TRAIN_ORIGINS`` origins of every
+    series with the horizon as a feature, so a single model and a single ``predict``
+    call cover all series and all horizon days. Returns a ``(series, horizon)`` array.
+    """
+    window = panel.shape[1]
+    rolling = [_rolling_means(panel, size) for size in ROLLING_WINDOWS]
+    temperatures = [_rolling_means(temperature, 7) for temperature in temperatures]
+
+    n_origins = int(np.clip(MAX_TRAIN_ROWS // max(len(panel) * horizon, 1), MIN_TRAIN_ORIGINS, TRAIN_ORIGINS))
+    first_origin = max(max(LAGS) - 1, window - horizon - n_origins)
+    origins = np.arange(first_origin, window - horizon)
+    native = codes[:len(CATEGORY_COLUMNS)]
+    codes = native + [_mean_encoding(panel, code, first_origin + 1) for code in codes[len(CATEGORY_COLUMNS):]]
+    X = _features(panel, rolling, temperatures, last_dates, codes, origins, horizon)
+    y = panel[:, origins[:, None] + np.arange(1, horizon + 1)[None, :]].reshape(-1)
+    keep = ~np.isnan(y)
+
+    categorical = [FEATURE_NAMES.index(column) for column in CATEGORY_COLUMNS]
+    model = HistGradientBoostingRegressor(categorical_features=categorical, **MODEL_PARAMS)
+    model.fit(X[keep], np.clip(y[keep], 0, None))
+
+    X_future = _features(panel, rolling, temperatures, last_dates, codes, np.array([window - 1]), horizon)
+    return model.predict(X_future).reshape(len(panel), horizon)
@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+from forecast.series import series_bounds, series_panel
+
+# Branch of the item-group totals over all branches
+ALL_BRANCHES = 'All branches'
+# Days of recent sales that set each item's share of its branch×item_group forecast
+PROPORTION_DAYS = 28
+# State of hierarchical runs, kept apart from that of per-item runs: the aggregates'
+# fingerprints and their unreconciled forecasts, which are reused when unchanged
+HIERARCHY_FINGERPRINT_FILE = 'data/forecast_state/fingerprints.hierarchy.json'
+AGGREGATE_FILE = 'data/forecast_state/aggregate_forecasts.csv'
+AGGREGATE_COLUMNS = {
+    'qty_sold': 'sum', 'day': 'first', 'is_weekend': 'first', 'temperature_2m_max': 'mean', 'temperature_2m_min': 'mean',
+}
+
+
+def aggregate_history(df):
+    """The branch×item_group and item_group sales totals, as series in the schema of ``df``.
+
+    Each aggregate is a series named after its item group; the totals over all branches
+    have the branch ``ALL_BRANCHES``. Sales are summed and temperatures averaged over
+    the items (and branches) of a date, so every engine forecasts aggregates as it does
+    items.
+    """
+    by_branch = df.groupby(['branch', 'item_group', 'date'], observed=True).agg(AGGREGATE_COLUMNS).reset_index()
+    totals = df.groupby(['item_group', 'date'], observed=True).agg(AGGREGATE_COLUMNS).reset_index()
+    totals['branch'] = ALL_BRANCHES
+    aggregates = pd.concat([by_branch, totals], ignore_index=True)
+    aggregates['item_name'] = aggregates['item_group']
+    for column in ['branch', 'item_name', 'item_group']:
+        aggregates[column] = aggregates[column].astype(str).astype('category')
+    return aggregates[list(df.columns)]
+
+
+def item_shares(df, min_rows, days=PROPORTION_DAYS):
+    """Share of every item (with more than ``min_rows`` rows) in its branch×item_group's recent sales.
+
+    Sales are summed over the ``days`` days up to the last date of the branch×item_group,
+    so items that stopped selling get a share of zero. The items of a branch×item_group
+    without sales in that window share it evenly. Returns the items in series order.
+    """
+    sorted_df, starts, stops = series_bounds(df)
+    long_enough = stops - starts > min_rows
+    starts, stops = starts[long_enough], stops[long_enough]
+    panel, last_dates = series_panel(sorted_df, starts, stops, days)
+    items = sorted_df.iloc[starts][['branch', 'item_name', 'item_group']].astype(str).reset_index(drop=True)
+
+    # Panels are aligned on each item's own last date; the window ends on the parent's
+    parent = pd.MultiIndex.from_frame(items[['branch', 'item_group']]).factorize()[0]
+    last_days = last_dates.astype(np.int64)
+    parent_last = np.full(parent.max() + 1, np.iinfo(np.int64).min)
+    np.maximum.at(parent_last, parent, last_days)
+    lag = parent_last[parent] - last_days
+    in_window = np.arange(days)[None, :] + lag[:, None] >= 0
+    sales = np.where(in_window, np.nan_to_num(panel), 0).sum(axis=1)
+
+    totals = np.bincount(parent, sales)[parent]
+    counts = np.bincount(parent)[parent]
+    items['share'] = np.where(totals > 0, sales / np.where(totals > 0, totals, 1), 1 / counts)
+    return items
+
+
+def reconcile(forecasts):
+    """Make the branch×item_group forecasts add up to their item-group totals, date by date.
+
+    ``forecasts`` holds the unreconciled forecasts of :func:`aggregate_history`'s series.
+    Each item group and date is a two-level tree, reconciled by ordinary least squares:
+    the total ``T`` and its ``n`` branch forecasts ``B`` all move by the same amount, so
+    every ``B`` gains ``(T - sum(B)) / (n + 1)`` and the total becomes the sum of the
+    adjusted branches. All trees are reconciled at once; bounds shift with their
+    forecast. Returns the reconciled branch×item_group and item_group forecasts.
+    """
+    values = [column for column in ['prediction', 'lower', 'upper'] if column in forecasts]
+    forecasts = forecasts.astype({column: float for column in values})
+    forecasts[['branch', 'item_group']] = forecasts[['branch', 'item_group']].astype(str)
+    is_total = forecasts['branch'] == ALL_BRANCHES
+    totals = forecasts.loc[is_total, ['item_group', 'date'] + values]
+    groups = forecasts.loc[~is_total, ['branch', 'item_group', 'date'] + values].merge(
+        totals[['item_group', 'date', 'prediction']].rename(columns={'prediction': 'total'}),
+        on=['item_group', 'date'], how='left',
+    )
+
+    by_date = groups.groupby(['item_group', 'date'])['prediction']
+    # Dates past the total's horizon (a branch whose sales ended earlier) are left as they are
+    adjustment = ((groups['total'] - by_date.transform('sum')) / (by_date.transform('size') + 1)).fillna(0)
+    for column in values:
+        groups[column] = np.clip(groups[column] + adjustment, 0, None)
+
+    # Clipping may lower a branch below its adjusted value, so the totals are re-summed
+    sums = groups[groups['total'].notna()].groupby(['item_group', 'date'], as_index=False)['prediction'].sum()
+    totals = totals.merge(sums, on=['item_group', 'date'], how='inner', suffixes=('_model', ''))
+    shift = totals['prediction'] - totals.pop('prediction_model')
+    for column in values[1:]:
+        totals[column] = np.clip(totals[column] + shift, 0, None)
+    totals.insert(0, 'branch', ALL_BRANCHES)
+    return groups.drop(columns='total'), totals[groups.columns.drop('total')]
+
+
+def disaggregate(groups, shares):
+    """Item forecasts: every branch×item_group forecast split by the shares of its items."""
+    values = [column for column in ['prediction', 'lower', 'upper'] if column in groups]
+    items = shares.reset_index(names='position').merge(groups, on=['branch', 'item_group'])
+    items[values] = items[values].mul(items.pop('share'), axis=0)
+    return items.sort_values(['position', 'date'], kind='stable').reset_index(drop=True)
+
+
+def reconcile_hierarchy(df, forecasts, min_rows, days=PROPORTION_DAYS):
+    """Reconciled aggregate forecasts and the item forecasts disaggregated from them.
+
+    Returns ``(aggregates, items)``: the branch×item_group rows followed by the
+    item-group totals, and the items (with more than ``min_rows`` rows) in series
+    order. Forecasts are rounded to whole units at the item level and summed up from
+    there, so the published levels add up exactly; bounds are rounded as they are.
+    """
+    groups, totals = reconcile(forecasts)
+    items = disaggregate(groups, item_shares(df, min_rows, days))
+    for table in (groups, totals, items):
+        table[['prediction', 'lower', 'upper']] = np.round(table[['prediction', 'lower', 'upper']])
+
+    keys = ['branch', 'item_group', 'date']
+    item_sums = items.groupby(keys)['prediction'].sum()
+    groups = groups.set_index(keys)
+    # A branch×item_group all of whose items are too short to publish keeps its own forecast
+    groups['prediction'] = item_sums.reindex(groups.index).fillna(groups['prediction'])
+    groups = groups.reset_index()
+    group_sums = groups.groupby(['item_group', 'date'])['prediction'].sum()
+    totals['prediction'] = group_sums.reindex(pd.MultiIndex.from_frame(totals[['item_group', 'date']])).to_numpy()
+
+    aggregates = pd.concat([groups, totals], ignore_index=True)
+    for table in (aggregates, items):
+        table['prediction'] = table['prediction'].astype(int)
+    return aggregates, items
@@ -0,0 +1,39 @@
+import warnings
+import numpy as np
+from scipy.stats import norm
+
+# off: point forecasts only; analytic: normal bounds from residuals, computed after
+# fitting; sample: Prophet's posterior simulation (slow, Prophet series only)
+INTERVAL_MODES = ['off', 'analytic', 'sample']
+INTERVAL_WIDTH = 0.8  # Prophet's default interval_width
+UNCERTAINTY_SAMPLES = 1000  # Prophet's default, used only in 'sample' mode
+
+
+def z_score(width=INTERVAL_WIDTH):
+    """Two-sided normal quantile of an interval of this coverage."""
+    return norm.ppf(0.5 + width / 2)
+
+
+def weekly_residual_sigma(panel):
+    """Noise level of every series of a ``(series, days)`` panel.
+
+    Estimated from the one-week differences: if the weekly pattern is stable, ``y[t] -
+    y[t-7]`` is the difference of two independent errors, so its standard deviation is
+    ``sqrt(2)`` times the error's.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        sigma = np.nanstd(panel[:, 7:] - panel[:, :-7], axis=1) / np.sqrt(2)
+    return np.nan_to_num(sigma)
+
+
+def analytic_bounds(forecasts, sigma, width=INTERVAL_WIDTH):
+    """Lower and upper bounds ``forecasts -/+ z * sigma``, clipped at zero.
+
+    ``forecasts`` is ``(series, horizon)`` (or one series' horizon) and ``sigma`` the
+    matching per-series noise level.
+    """
+    half_width = z_score(width) * np.asarray(sigma, dtype=np.float64)
+    if np.ndim(forecasts) == 2:
+        half_width = half_width[:, None]
+    return np.clip(forecasts - half_width, 0, None), np.clip(forecasts + half_width, 0, None)
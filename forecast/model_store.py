@@ -0,0 +1,115 @@
+import os
+import socket
+import hashlib
+import logging
+import numpy as np
+from prophet.serialize import model_from_json, model_to_json
+
+MODEL_STORE_DIR = 'data/model_store'
+MAX_STORE_MB = 1024
+
+
+def training_hash(train, config=''):
+    """Hash of the exact frame a model is fitted on, plus the model settings.
+
+    Only pass numeric and datetime columns: object columns would hash their pointers.
+    """
+    digest = hashlib.sha1(config.encode())
+    for col in sorted(train.columns):
+        digest.update(col.encode())
+        digest.update(np.ascontiguousarray(train[col].to_numpy()).tobytes())
+    return digest.hexdigest()
+
+
+def warm_start_params(model):
+    """Initial values for Stan taken from a fitted model (as in the Prophet docs)."""
+    params = {}
+    for name in ['k', 'm', 'sigma_obs']:
+        params[name] = model.params[name][0][0]
+    for name in ['delta', 'beta']:
+        params[name] = model.params[name][0]
+    return params
+
+
+class ModelStore:
+    """Fitted Prophet models on disk, keyed by series and training-data hash.
+
+    Layout: ``<root>/<series digest>/<training hash>.json``. A model fitted on exactly
+    the same data can be reloaded to predict again (for any horizon) without fitting,
+    and the newest model of a series seeds a warm-started fit when its data changed.
+    The store is trimmed to ``max_mb`` by evicting the least recently used files.
+    Several worker processes, and several machines sharing the directory, may use the
+    same store; every file is written atomically.
+    """
+
+    def __init__(self, root=MODEL_STORE_DIR, max_mb=MAX_STORE_MB):
+        self.root = root
+        self.max_bytes = max_mb * 2**20
+
+    def _series_dir(self, key):
+        return os.path.join(self.root, hashlib.sha1(key.encode()).hexdigest()[:16])
+
+    def get(self, key, data_hash):
+        """Return the model fitted on ``data_hash`` for this series, or None."""
+        path = os.path.join(self._series_dir(key), f'{data_hash}.json')
+        if not os.path.exists(path):
+            return None
+        os.utime(path)  # mark as recently used for eviction
+        return self._load(path)
+
+    def latest(self, key):
+        """Return the most recently stored model of this series, or None."""
+        series_dir = self._series_dir(key)
+        if not os.path.isdir(series_dir):
+            return None
+        paths = [os.path.join(series_dir, name) for name in os.listdir(series_dir) if name.endswith('.json')]
+        if not paths:
+            return None
+        return self._load(max(paths, key=os.path.getmtime))
+
+    def put(self, key, data_hash, model):
+        """Serialize a fitted model under this series and training hash."""
+        series_dir = self._series_dir(key)
+        os.makedirs(series_dir, exist_ok=True)
+        path = os.path.join(series_dir, f'{data_hash}.json')
+        tmp_path = f'{path}.{socket.gethostname()}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(model_to_json(model))
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """Delete the least recently used models until the store fits in its size budget."""
+        if not os.path.isdir(self.root):
+            return 0
+        files = []
+        for series_dir, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith('.json'):
+                    path = os.path.join(series_dir, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:  # evicted by another process meanwhile
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        evicted = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        if evicted:
+            logging.info(f"Evicted {evicted} model(s) from {self.root}")
+        return evicted
+
+    def _load(self, path):
+        try:
+            with open(path, 'r') as f:
+                return model_from_json(f.read())
+        except (OSError, ValueError) as err:
+            logging.warning(f"Ignoring unreadable model {path}: {err}")
+            return None
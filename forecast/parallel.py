@@ -0,0 +1,36 @@
+import os
+import collections
+from concurrent.futures import ProcessPoolExecutor
+
+
+def default_workers():
+    """Number of worker processes when none is configured: all cores but one."""
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def ordered_imap(pool, func, iterable, window):
+    """Like ``pool.map`` but keeps at most ``window`` tasks in flight.
+
+    ``Executor.map`` submits every task up front, which would pickle the whole history
+    into the call queue at once. Results are yielded in submission order so the output
+    is deterministic regardless of which worker finishes first.
+    """
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(pool.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def make_pool(workers, initializer=None, initargs=(), max_tasks_per_child=None):
+    """Create the process pool used by the forecasting job.
+
+    Workers are replaced after ``max_tasks_per_child`` tasks so memory held on to by a
+    fitted model (Stan, pandas caches) cannot pile up in a long-lived worker.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers, initializer=initializer, initargs=initargs,
+        max_tasks_per_child=max_tasks_per_child,
+    )
@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import logging
+import warnings
+import numpy as np
+import pandas as pd
+from cmdstanpy.utils import get_logger as cmdstanpy_logger
+from prophet import Prophet
+from instrumentation import peak_rss_mb
+from forecast.fingerprints import series_key
+from forecast.model_store import training_hash, warm_start_params
+from forecast.intervals import INTERVAL_WIDTH, UNCERTAINTY_SAMPLES, analytic_bounds
+from forecast.telemetry import optimizer_iterations
+
+warnings.filterwarnings('ignore')
+
+REGRESSOR_COLUMNS = ['is_weekend', 'temperature_2m_max', 'temperature_2m_min', 'day']
+
+# Settings a tuning run may change; these defaults apply to untuned series
+DEFAULT_PARAMS = {'seasonality_mode': 'additive', 'changepoint_prior_scale': 0.05, 'fourier_order': 3}
+
+# Part of every stored model's hash; bump it when build_prophet_model changes
+MODEL_CONFIG = 'prophet-v4|logistic|weakly|PK|' + ','.join(REGRESSOR_COLUMNS)
+
+# Shared, read-only inputs of a worker process, set once by init_worker instead of being
+# pickled along with every series
+_regressor_table = None
+_model_store = None
+_tuned_params = {}
+_intervals = 'off'
+
+
+def init_worker(regressor_table, model_store=None, tuned_params=None, intervals='off'):
+    """Pool initializer: keep the regressor table, model store and tuned parameters in the worker.
+
+    ``tuned_params`` maps series keys to the parameters of that series; other series use
+    ``DEFAULT_PARAMS``. ``intervals`` is one of ``INTERVAL_MODES``.
+    """
+    global _regressor_table, _model_store, _tuned_params, _intervals
+    _regressor_table = regressor_table
+    _model_store = model_store
+    _tuned_params = tuned_params or {}
+    _intervals = intervals
+    # cmdstanpy logs every fit at INFO level, which floods the output with many workers.
+    # Its get_logger() resets the level on first use, so set it after that call.
+    cmdstanpy_logger().setLevel(logging.WARNING)
+
+
+def resolve_params(params=None):
+    """``DEFAULT_PARAMS`` updated with the given (e.g. tuned) parameters."""
+    return {**DEFAULT_PARAMS, **(params or {})}
+
+
+def build_prophet_model(holidays, params=None):
+    """Create the unfitted Prophet model used for every series."""
+    params = resolve_params(params)
+    # Initialize the Prophet model with logistic growth; the country holidays come
+    # precomputed from the regressor table instead of being rebuilt on every fit
+    prophet_model = Prophet(
+        seasonality_mode=params['seasonality_mode'], growth='logistic', holidays=holidays,
+        changepoint_prior_scale=params['changepoint_prior_scale'],
+    )
+    prophet_model.add_seasonality(name='weakly', period=7.0, fourier_order=params['fourier_order'])
+
+    # Add regressors
+    for regressor in REGRESSOR_COLUMNS:
+        prophet_model.add_regressor(regressor)
+    return prophet_model
+
+
+def fit_prophet_model(train, key, params=None, stats=None):
+    """Return a model fitted on ``train``, reusing the model store when one is configured.
+
+    A stored model with the same training hash is returned as is. Otherwise the newest
+    stored model of the series warm-starts the fit; if its parameters do not fit the new
+    model (e.g. a different number of holiday columns) the fit falls back to a cold start.
+    A ``stats`` dict gets the ``fit_mode`` and optimizer ``iterations``.
+    """
+    stats = {} if stats is None else stats
+    holidays = _regressor_table.holidays_for(train['ds'])
+    if _model_store is None:
+        prophet_model = build_prophet_model(holidays, params)
+        prophet_model.fit(train)
+        stats.update(fit_mode='cold', iterations=optimizer_iterations(prophet_model))
+        return prophet_model
+
+    config = MODEL_CONFIG + json.dumps(resolve_params(params), sort_keys=True)
+    data_hash = training_hash(train[['ds', 'y', 'cap'] + REGRESSOR_COLUMNS], config)
+    prophet_model = _model_store.get(key, data_hash)
+    if prophet_model is not None:
+        stats.update(fit_mode='stored')
+        return prophet_model
+
+    previous_model = _model_store.latest(key)
+    prophet_model = build_prophet_model(holidays, params)
+    stats.update(fit_mode='cold')
+    if previous_model is None:
+        prophet_model.fit(train)
+    else:
+        try:
+            prophet_model.fit(train, init=warm_start_params(previous_model))
+            stats.update(fit_mode='warm')
+        except Exception as err:
+            print(f"Warm start failed for {key} ({err}), fitting from scratch.")
+            prophet_model = build_prophet_model(holidays, params)
+            prophet_model.fit(train)
+    stats.update(iterations=optimizer_iterations(prophet_model))
+    _model_store.put(key, data_hash, prophet_model)
+    return prophet_model
+
+
+def fit_predict(train, warehouse, key, future_dates, params=None, stats=None):
+    """Fit on one series' ``train`` rows (indexed by date) and predict ``future_dates``.
+
+    ``params`` override ``DEFAULT_PARAMS``. Returns a frame with ``yhat`` and, unless the
+    interval mode is 'off', ``yhat_lower`` and ``yhat_upper``; None if the series has too
+    little data. A ``stats`` dict gets the training ``rows``, the fit and predict wall
+    times and what :func:`fit_prophet_model` reports.
+    """
+    stats = {} if stats is None else stats
+    train = train.drop_duplicates()
+    stats.update(rows=len(train))
+    if train['qty_sold'].dropna().shape[0] < 2:
+        return None
+
+    # Calculate the cap as the mode of qty_sold
+    cap_value = train['qty_sold'].mode().iloc[0]
+
+    # Prepare data for Prophet with logistic growth cap
+    train = train.reset_index().rename(columns={'date': 'ds', 'qty_sold': 'y'})
+    train['cap'] = cap_value
+
+    # Fit the model, or take it from the model store
+    fit_start = time.perf_counter()
+    prophet_model = fit_prophet_model(train, key, params, stats)
+    predict_start = time.perf_counter()
+    stats.update(fit_seconds=predict_start - fit_start)
+    # Posterior simulation is what makes predict slow; it only runs in 'sample' mode
+    prophet_model.uncertainty_samples = UNCERTAINTY_SAMPLES if _intervals == 'sample' else 0
+    prophet_model.interval_width = INTERVAL_WIDTH
+
+    # Only the forecast days are predicted; their regressors are looked up in the shared
+    # table, which has one row per date and branch
+    future = pd.DataFrame({'ds': pd.DatetimeIndex(future_dates), 'cap': cap_value})
+    future = pd.concat([future, _regressor_table.regressors(warehouse, future['ds'])], axis=1)
+
+    if _intervals != 'analytic':
+        # Make predictions
+        columns = ['yhat', 'yhat_lower', 'yhat_upper'] if _intervals == 'sample' else ['yhat']
+        prediction = prophet_model.predict(future)[columns].reset_index(drop=True)
+        stats.update(predict_seconds=time.perf_counter() - predict_start)
+        return prediction
+
+    # Analytic bounds: the training days are predicted in the same call, and the spread
+    # of their residuals sets the width of the bounds
+    history = train[['ds', 'cap'] + REGRESSOR_COLUMNS]
+    yhat = prophet_model.predict(pd.concat([history, future], ignore_index=True))['yhat'].to_numpy()
+    stats.update(predict_seconds=time.perf_counter() - predict_start)
+    sigma = np.nanstd(train['y'].to_numpy() - yhat[:len(history)])
+    lower, upper = analytic_bounds(yhat[len(history):], sigma)
+    return pd.DataFrame({'yhat': yhat[len(history):], 'yhat_lower': lower, 'yhat_upper': upper})
+
+
+def forecast_series(category_df, forecast_periods=7, stats=None):
+    """Fit a logistic-growth Prophet model on one (branch, item) series.
+
+    Returns the forecast rows for the next ``forecast_periods`` days, or None if the
+    series is skipped. A ``stats`` dict gets the fit telemetry (see :func:`fit_predict`).
+    """
+    category = category_df['item_name'].iloc[0]
+    warehouse = category_df['branch'].iloc[0]
+    if len(category_df) <= forecast_periods:
+        return None
+
+    # Fit on the whole history and forecast the week after the last actual date, like
+    # the batch engines
+    train = category_df.set_index('date')
+    future_dates = pd.date_range(train.index.max() + pd.Timedelta(days=1), periods=forecast_periods, freq='D')
+    key = series_key(warehouse, category)
+    prophet_forecast = fit_predict(train, warehouse, key, future_dates, _tuned_params.get(key), stats)
+    if prophet_forecast is None:
+        print(f"Skipping category '{category}' due to insufficient data.")
+        return None
+
+    results = pd.DataFrame({
+        'date': future_dates,
+        'prediction': np.round(abs(prophet_forecast['yhat'].to_numpy())).astype(int),
+        'item_name': category,
+        'branch': warehouse,
+        'item_group': category_df['item_group'].iloc[0],
+    })
+    if _intervals != 'off':
+        results['lower'] = np.round(np.clip(prophet_forecast['yhat_lower'].to_numpy(), 0, None))
+        results['upper'] = np.round(np.clip(prophet_forecast['yhat_upper'].to_numpy(), 0, None))
+    return results
+
+
+def forecast_series_safe(category_df, forecast_periods=7):
+    """:func:`forecast_series`, but a series that raises is reported and skipped instead of ending the run.
+
+    Returns the forecast rows (or None) and the series' telemetry record.
+    """
+    record = {'engine': 'prophet', 'rows': len(category_df)}
+    try:
+        results = forecast_series(category_df, forecast_periods, record)
+        if results is None:
+            record['skip_reason'] = 'insufficient data'
+    except Exception as err:
+        print(f"Forecast failed for {category_df['item_name'].iloc[0]} of {category_df['branch'].iloc[0]}: {err!r}")
+        results = None
+        record['skip_reason'] = 'error'
+    record.update(peak_rss_mb=peak_rss_mb(), pid=os.getpid())
+    return results, record
@@ -0,0 +1,44 @@
+import pandas as pd
+from prophet.make_holidays import make_holidays_df
+
+HOLIDAY_COUNTRY = 'PK'
+TEMPERATURE_COLUMNS = ['temperature_2m_max', 'temperature_2m_min']
+
+
+class RegressorTable:
+    """Regressors of every branch for every day of the run, built once and shared by all series.
+
+    Covers the history plus ``horizon`` days. Each branch has one frame indexed by a
+    unique daily date index with the calendar columns (``is_weekend``, ``day``) and the
+    branch's temperatures; days without a temperature (the horizon, gaps) get the
+    historical mean. The country holidays of the covered years are computed once too.
+    """
+
+    def __init__(self, df, horizon):
+        self.horizon = horizon
+        dates = pd.date_range(df['date'].min(), df['date'].max() + pd.Timedelta(days=horizon), freq='D')
+        calendar = pd.DataFrame({'is_weekend': dates.dayofweek >= 5, 'day': dates.day}, index=dates)
+
+        historical_means = df[TEMPERATURE_COLUMNS].mean()
+        # Every item of a branch carries the same weather, so one row per (branch, date)
+        temperatures = df.groupby(['branch', 'date'], observed=True)[TEMPERATURE_COLUMNS].mean()
+        self.branches = {}
+        for branch, branch_temperatures in temperatures.groupby(level='branch', observed=True):
+            branch_temperatures = branch_temperatures.droplevel('branch').reindex(dates)
+            self.branches[branch] = calendar.join(branch_temperatures.fillna(historical_means))
+
+        self.holidays = make_holidays_df(year_list=sorted(set(dates.year)), country=HOLIDAY_COUNTRY)
+
+    def regressors(self, branch, ds):
+        """Regressor columns of ``branch`` for the dates ``ds``, aligned with ``ds``."""
+        return self.branches[branch].reindex(pd.DatetimeIndex(ds)).reset_index(drop=True)
+
+    def holidays_for(self, ds):
+        """The holidays in the years spanned by ``ds`` and the ``horizon`` days after it.
+
+        Prophet computes country holidays for the predicted dates too, so a forecast week
+        that crosses into a new year keeps e.g. New Year's Day.
+        """
+        ds = pd.DatetimeIndex(ds)
+        years = range(ds.min().year, (ds.max() + pd.Timedelta(days=self.horizon)).year + 1)
+        return self.holidays[self.holidays['ds'].dt.year.isin(years)]
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+SERIES_KEYS = ['branch', 'item_name']
+
+
+def series_bounds(df, keys=SERIES_KEYS):
+    """Sort ``df`` once by series and return it with the [start, stop) row range of each series.
+
+    Keys are ranked by first appearance, so series come out in the same order as a nested
+    loop over ``df[key].unique()``. The sort is stable, so rows keep their original order
+    inside a series. Pairs that never occur together do not appear at all.
+    """
+    codes = [pd.factorize(df[key])[0] for key in keys]
+    order = np.lexsort(codes[::-1])
+    sorted_df = df.take(order)
+
+    sorted_codes = np.column_stack([code[order] for code in codes])
+    changes = np.flatnonzero((sorted_codes[1:] != sorted_codes[:-1]).any(axis=1)) + 1
+    starts = np.concatenate(([0], changes))
+    stops = np.concatenate((changes, [len(df)]))
+    return sorted_df, starts, stops
+
+
+def series_panel(sorted_df, starts, stops, window, value='qty_sold'):
+    """Right-aligned ``(series, window)`` array of the last ``window`` days of each series.
+
+    ``sorted_df``, ``starts`` and ``stops`` come from :func:`series_bounds` (possibly with
+    some series filtered out). Column ``window - 1`` is the last date of every series, so
+    column ``j`` of all series is the same number of days before their own end. Days
+    without a row are NaN. Also returns each series' last date.
+    """
+    lengths = stops - starts
+    series_id = np.repeat(np.arange(len(starts)), lengths)
+    # Positions of the selected rows: each series' [start, stop) range laid end to end
+    offsets = np.cumsum(lengths) - lengths
+    rows = np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths)
+
+    dates = sorted_df['date'].to_numpy('datetime64[D]').astype(np.int64)[rows]
+    last_dates = np.full(len(starts), np.iinfo(np.int64).min)
+    np.maximum.at(last_dates, series_id, dates)
+    column = window - 1 - (last_dates[series_id] - dates)
+    inside = column >= 0
+
+    panel = np.full((len(starts), window), np.nan)
+    values = sorted_df[value].to_numpy(np.float64)[rows]
+    panel[series_id[inside], column[inside]] = values[inside]
+    return panel, last_dates.astype('datetime64[D]')
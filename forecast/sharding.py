@@ -0,0 +1,114 @@
+import os
+import json
+import argparse
+import hashlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from forecast.fingerprints import FINGERPRINT_FILE, load_fingerprints, series_key
+
+SHARD_DIR = 'data/forecast_shards'
+
+
+def parse_shard(text):
+    """Parse ``i/n`` (shard ``i`` of ``n``, counting from 0) for argparse."""
+    try:
+        shard, shards = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/n, got {text!r}")
+    if shards < 1 or not 0 <= shard < shards:
+        raise argparse.ArgumentTypeError(f"shard must satisfy 0 <= i < n, got {text!r}")
+    return shard, shards
+
+
+def shard_of(key, shards):
+    """Shard of a series key; a stable hash, so every node and every run agree."""
+    return int(hashlib.sha1(key.encode()).hexdigest()[:8], 16) % shards
+
+
+def shard_mask(branches, item_names, shard, shards):
+    """Boolean mask of the series that belong to ``shard`` of ``shards``."""
+    return np.array([
+        shard_of(series_key(branch, item_name), shards) == shard
+        for branch, item_name in zip(branches, item_names)
+    ], dtype=bool)
+
+
+def shard_name(shard, shards):
+    return f'shard-{shard}-of-{shards}'
+
+
+def shard_output(shard, shards, directory=SHARD_DIR):
+    """Path of one shard's partial forecast table."""
+    return os.path.join(directory, f'{shard_name(shard, shards)}.parquet')
+
+
+def shard_fingerprint_file(shard, shards, path=FINGERPRINT_FILE):
+    """Fingerprints of one shard, kept apart until the merge so nodes never share a file."""
+    root, ext = os.path.splitext(path)
+    return f'{root}.{shard_name(shard, shards)}{ext}'
+
+
+def write_shard(results, shard, shards, signature, expected_series, directory=SHARD_DIR):
+    """Write one shard's forecasts (with their ``position``) and what the merge checks them against."""
+    os.makedirs(directory, exist_ok=True)
+    metadata = {'shard': shard, 'shards': shards, 'signature': signature, 'expected_series': int(expected_series)}
+    table = pa.Table.from_pandas(results, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'forecast_shard': json.dumps(metadata).encode()})
+    path = shard_output(shard, shards, directory)
+    pq.write_table(table, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+def merge_shards(shards, periods, directory=SHARD_DIR):
+    """Assemble and validate the partial outputs of all ``shards`` shards.
+
+    Checks that every shard is present and comes from the same input history and
+    settings, that every series sits in the shard its hash assigns it to, appears in one
+    shard only and has ``periods`` rows. Raises ValueError listing every problem found.
+    Returns the merged forecasts in series order.
+    """
+    problems = []
+    frames = []
+    signatures = set()
+    for shard in range(shards):
+        path = shard_output(shard, shards, directory)
+        if not os.path.exists(path):
+            problems.append(f"{shard_name(shard, shards)}: missing ({path})")
+            continue
+        table = pq.read_table(path)
+        metadata = json.loads(table.schema.metadata[b'forecast_shard'])
+        signatures.add(metadata['signature'])
+        frame = table.to_pandas()
+        keys = frame['branch'].astype(str) + '|' + frame['item_name'].astype(str)
+        wrong = {key for key in keys.unique() if shard_of(key, shards) != shard}
+        if wrong:
+            problems.append(f"{shard_name(shard, shards)}: {len(wrong)} series belong to another shard")
+        produced = keys.nunique()
+        if produced < metadata['expected_series']:
+            print(f"{shard_name(shard, shards)}: {metadata['expected_series'] - produced} series "
+                  f"were skipped (too little data or a failed fit)")
+        frames.append(frame)
+    if len(signatures) > 1:
+        problems.append("shards were produced from different histories or settings")
+
+    merged = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if not merged.empty:
+        duplicated = merged.duplicated(['branch', 'item_name', 'date']).sum()
+        if duplicated:
+            problems.append(f"{duplicated} duplicate (branch, item_name, date) rows")
+        rows = merged.groupby(['branch', 'item_name']).size()
+        if (rows != periods).any():
+            problems.append(f"{(rows != periods).sum()} series do not have {periods} forecast rows")
+    if problems:
+        raise ValueError("Cannot merge shards:\n  " + "\n  ".join(problems))
+    return merged.sort_values('position', kind='stable').reset_index(drop=True)
+
+
+def merge_fingerprints(shards, path=FINGERPRINT_FILE):
+    """Combine the shards' fingerprint files into one, as an unsharded run would write it."""
+    fingerprints = {}
+    for shard in range(shards):
+        fingerprints.update(load_fingerprints(shard_fingerprint_file(shard, shards, path)))
+    return fingerprints
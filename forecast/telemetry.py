@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+from instrumentation import peak_rss_mb
+
+REPORT_DIR = 'data/forecast_run/report'
+# Series listed in the summary, slowest first
+SLOWEST_SERIES = 20
+REPORT_COLUMNS = [
+    'position', 'branch', 'item_name', 'item_group', 'engine', 'rows', 'fit_seconds', 'predict_seconds',
+    # Optimizer iterations and whether the fit was 'cold', 'warm' (started from the
+    # stored model) or 'stored' (taken from the model store); Prophet series only
+    'iterations', 'fit_mode',
+    # Why no model was fitted: 'insufficient data', 'error', 'unchanged' (last run's
+    # forecast reused) or 'resumed' (forecast by the interrupted run)
+    'skip_reason',
+    # High-water mark of the resident memory of the process that forecast the series,
+    # right after it did
+    'peak_rss_mb', 'pid',
+]
+
+
+def optimizer_iterations(prophet_model):
+    """Iterations of the optimizer run of a freshly fitted Prophet model, or None.
+
+    cmdstanpy does not return the count, so it is read from the last line of the
+    optimizer's iteration table in the console output it keeps next to the fit.
+    """
+    try:
+        with open(prophet_model.stan_fit.runset.stdout_files[0], 'r') as f:
+            lines = f.read().splitlines()
+    except (AttributeError, IndexError, OSError):
+        return None
+    for line in reversed(lines):
+        fields = line.split()
+        if fields and fields[0].isdigit():
+            return int(fields[0])
+    return None
+
+
+class RunReport:
+    """Per-series telemetry of a forecasting run.
+
+    Every forecast or skipped series adds one record with the ``REPORT_COLUMNS``. The
+    batch engines fit all their series at once, so each of their series is charged an
+    equal share of the batch's time.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.started = time.perf_counter()
+
+    def add(self, record):
+        self.records.append(record)
+
+    def add_batch(self, first_rows, positions, engines, rows, seconds=0.0, skip_reason=None):
+        """Add several series at once (given by the ``first_rows`` of their histories), each with ``seconds`` of fit time."""
+        for position, branch, item_name, item_group, engine, count in zip(
+                positions, first_rows['branch'], first_rows['item_name'], first_rows['item_group'], engines, rows):
+            self.add({
+                'position': int(position), 'branch': branch, 'item_name': item_name, 'item_group': item_group,
+                'engine': engine, 'rows': int(count), 'fit_seconds': seconds,
+                'skip_reason': skip_reason, 'peak_rss_mb': peak_rss_mb(), 'pid': os.getpid(),
+            })
+
+    def table(self):
+        """The records as a frame sorted by series position."""
+        table = pd.DataFrame(self.records, columns=REPORT_COLUMNS)
+        table[['fit_seconds', 'predict_seconds', 'peak_rss_mb']] = (
+            table[['fit_seconds', 'predict_seconds', 'peak_rss_mb']].astype(float).fillna(0.0)
+        )
+        table['iterations'] = table['iterations'].astype('Int32')
+        return table.sort_values('position', kind='stable').reset_index(drop=True)
+
+    def summary(self, table, slowest=SLOWEST_SERIES):
+        """Run totals, time and counts per engine and skip reason, and the slowest series."""
+        seconds = table['fit_seconds'] + table['predict_seconds']
+        engines = table.assign(seconds=seconds).groupby('engine').agg(
+            series=('position', 'size'), seconds=('seconds', 'sum'), mean_seconds=('seconds', 'mean'),
+            rows=('rows', 'sum'),
+        )
+        slowest_rows = table.assign(seconds=seconds).nlargest(slowest, 'seconds').round(4)
+        slowest_rows = slowest_rows.astype(object).where(slowest_rows.notna(), None)
+        workers = table[table['pid'] != os.getpid()]
+        return {
+            'series': len(table),
+            'wall_seconds': round(time.perf_counter() - self.started, 3),
+            'parent_peak_rss_mb': round(peak_rss_mb(), 1),
+            'worker_peak_rss_mb': round(float(workers['peak_rss_mb'].max()), 1) if len(workers) else 0.0,
+            'skipped': table['skip_reason'].value_counts().to_dict(),
+            'engines': engines.round(3).to_dict(orient='index'),
+            'slowest': [
+                {column: row[column] for column in
+                 ['branch', 'item_name', 'engine', 'rows', 'fit_seconds', 'predict_seconds', 'iterations', 'fit_mode']}
+                for _, row in slowest_rows.iterrows()
+            ],
+        }
+
+    def write(self, directory=REPORT_DIR, slowest=SLOWEST_SERIES):
+        """Write ``series.parquet`` and ``summary.json`` to ``directory``; returns the summary."""
+        os.makedirs(directory, exist_ok=True)
+        table = self.table()
+        summary = self.summary(table, slowest)
+        path = os.path.join(directory, 'series.parquet')
+        table.to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+        path = os.path.join(directory, 'summary.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(summary, f, indent=1, default=_json_value)
+        os.replace(path + '.tmp', path)
+        return summary
+
+
+def _json_value(value):
+    """NumPy scalars as plain Python numbers, for json.dump."""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def print_slowest(summary, count=10):
+    """Print the slowest series of a run report summary."""
+    print(f"Slowest series ({summary['wall_seconds']:.1f}s run, peak RSS {summary['parent_peak_rss_mb']:.0f} MB "
+          f"parent / {summary['worker_peak_rss_mb']:.0f} MB worker):")
+    for row in summary['slowest'][:count]:
+        print(f"  {row['fit_seconds'] + row['predict_seconds']:7.2f}s  {row['engine']:<22} {row['rows']:>5} rows  "
+              f"{row['item_name']} of {row['branch']}")
@@ -0,0 +1,160 @@
+import os
+import json
+import math
+import hashlib
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import ParameterGrid
+from forecast.fingerprints import series_key
+from forecast.parallel import make_pool, ordered_imap
+from forecast import prophet_engine
+
+TUNED_PARAMS_FILE = 'data/forecast_state/tuned_params.json'
+PARAM_GRID = {
+    'seasonality_mode': ['additive', 'multiplicative'],
+    'changepoint_prior_scale': [0.01, 0.05, 0.5],
+    'fourier_order': [3, 5],
+}
+TUNE_FOLDS = 3
+TUNE_STEP_DAYS = 7
+# After each fold only the best 1/PRUNE_FACTOR of the configurations go on to the next
+PRUNE_FACTOR = 2
+# An item group is tuned on its MAX_SERIES_PER_GROUP longest series
+MAX_SERIES_PER_GROUP = 5
+
+
+def grid_hash(grid):
+    """Short hash of a parameter grid, stored with the winners to detect a changed grid."""
+    return hashlib.sha1(json.dumps(grid, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def group_key(item_group):
+    """Key of an item group's tuned parameters (series use :func:`series_key`)."""
+    return f'item_group={item_group}'
+
+
+def load_grid(path=None):
+    """The search grid: ``PARAM_GRID``, or a JSON object of parameter lists from ``path``."""
+    if path is None:
+        return PARAM_GRID
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def load_tuned_params(path=TUNED_PARAMS_FILE):
+    """Load the cached winners, keyed by series or item group key."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_tuned_params(tuned, path=TUNED_PARAMS_FILE):
+    """Write the cached winners atomically."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(tuned, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def params_for(tuned, branch, item_name, item_group):
+    """Parameters of one series: its own winner, else its item group's, else None (defaults)."""
+    entry = tuned.get(series_key(branch, item_name)) or tuned.get(group_key(item_group))
+    return entry['params'] if entry else None
+
+
+def tuning_units(series_dfs, level):
+    """Group the series to tune into ``(unit key, [series_df, ...])`` tasks.
+
+    ``level`` is 'series' (one unit per series) or 'item_group' (one unit per group,
+    scored on its ``MAX_SERIES_PER_GROUP`` longest series).
+    """
+    if level == 'series':
+        return [
+            (series_key(category_df['branch'].iloc[0], category_df['item_name'].iloc[0]), [category_df])
+            for category_df in series_dfs
+        ]
+    groups = {}
+    for category_df in series_dfs:
+        groups.setdefault(category_df['item_group'].iloc[0], []).append(category_df)
+    return [
+        (group_key(item_group), sorted(members, key=len, reverse=True)[:MAX_SERIES_PER_GROUP])
+        for item_group, members in groups.items()
+    ]
+
+
+def _fold_error(series_dfs, params, offset, horizon):
+    """MAE of one configuration on one fold, over all observed test days of the unit's series."""
+    errors = []
+    for category_df in series_dfs:
+        cutoff = category_df['date'].max() - pd.Timedelta(days=offset)
+        history = category_df.set_index('date')
+        test = history.loc[(history.index > cutoff) & (history.index <= cutoff + pd.Timedelta(days=horizon)), 'qty_sold']
+        if test.empty:
+            continue
+        warehouse, category = category_df['branch'].iloc[0], category_df['item_name'].iloc[0]
+        predicted = prophet_engine.fit_predict(
+            history[history.index <= cutoff], warehouse, series_key(warehouse, category), test.index, params
+        )
+        if predicted is not None:
+            errors.append(np.abs(np.clip(predicted['yhat'].to_numpy(), 0, None) - test.to_numpy()))
+    return float(np.concatenate(errors).mean()) if errors else math.inf
+
+
+def tune_unit(task):
+    """Successive-halving search of one unit's grid over the backtest folds.
+
+    Every configuration is scored on the newest fold; only the best ``1/PRUNE_FACTOR``
+    of them are scored on the next (older) fold, and so on, so most fits are spent on
+    promising configurations. The winner has the lowest mean MAE over the folds it
+    reached. Returns ``(unit key, cache entry)``.
+    """
+    key, series_dfs, grid, horizon = task
+    candidates = list(ParameterGrid(grid))
+    totals = [0.0] * len(candidates)
+    alive = list(range(len(candidates)))
+    fits = 0
+    for fold in range(TUNE_FOLDS):
+        offset = horizon + TUNE_STEP_DAYS * fold
+        for index in alive:
+            totals[index] += _fold_error(series_dfs, candidates[index], offset, horizon)
+            fits += len(series_dfs)
+        alive.sort(key=lambda index: totals[index])
+        if fold < TUNE_FOLDS - 1:
+            alive = alive[:max(1, math.ceil(len(alive) / PRUNE_FACTOR))]
+    best = alive[0]
+    return key, {
+        'params': candidates[best],
+        'mae': totals[best] / TUNE_FOLDS,
+        'grid': grid_hash(grid),
+        'fits': fits,
+    }
+
+
+def tune(series_dfs, level, grid, regressor_table, horizon, workers, max_tasks_per_child=None,
+         retune=False, path=TUNED_PARAMS_FILE):
+    """Search ``grid`` on the process pool for every unit without a cached winner.
+
+    Units tuned with the same grid before are skipped unless ``retune``. Winners are
+    saved as they come in, so an interrupted search keeps its finished units. Returns
+    the updated cache.
+    """
+    tuned = load_tuned_params(path)
+    grid_id = grid_hash(grid)
+    units = [
+        (key, unit_dfs) for key, unit_dfs in tuning_units(series_dfs, level)
+        if retune or tuned.get(key, {}).get('grid') != grid_id
+    ]
+    print(f"Tuning {len(units)} {level} unit(s) over {len(ParameterGrid(grid))} configurations")
+    if not units:
+        return tuned
+
+    tasks = ((key, unit_dfs, grid, horizon) for key, unit_dfs in units)
+    with make_pool(workers, prophet_engine.init_worker, (regressor_table,), max_tasks_per_child) as pool:
+        for key, entry in ordered_imap(pool, tune_unit, tasks, window=2 * workers):
+            print(f"Tuned {key}: {entry['params']} (MAE {entry['mae']:.2f}, {entry['fits']} fits)")
+            tuned[key] = entry
+            # Re-read before saving so that winners saved meanwhile by other shards are kept
+            save_tuned_params({**load_tuned_params(path), key: entry}, path)
+    return tuned
@@ -0,0 +1,124 @@
+import os
+import time
+import shutil
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+RESULTS_DIR = 'data/forecast_run/results'
+ROW_GROUP_ROWS = 10_000
+# Buffered rows are also flushed after this long, bounding the work a crash can lose
+FLUSH_SECONDS = 30
+RESULT_SCHEMA = pa.schema([
+    ('date', pa.timestamp('ns')),
+    ('prediction', pa.int32()),
+    ('item_name', pa.string()),
+    ('branch', pa.string()),
+    ('item_group', pa.string()),
+    # Prediction bounds, NaN when intervals are off
+    ('lower', pa.float32()),
+    ('upper', pa.float32()),
+    # Index of the series in the run, to restore series order when publishing
+    ('position', pa.int32()),
+])
+
+
+class ResultWriter:
+    """Streaming sink for forecast rows.
+
+    Rows are appended column by column to an in-memory buffer, which is written out as
+    a new Parquet part file whenever it holds ``row_group_rows`` rows or has not been
+    written for ``flush_seconds``. Each part file is complete on its own (written to a
+    temporary name, then renamed), so the results of a run can be read with
+    :func:`read_results` while it is still going, and memory does not grow with the
+    number of series.
+    """
+
+    def __init__(self, directory=RESULTS_DIR, row_group_rows=ROW_GROUP_ROWS, flush_seconds=FLUSH_SECONDS):
+        self.directory = directory
+        self.row_group_rows = row_group_rows
+        self.flush_seconds = flush_seconds
+        os.makedirs(directory, exist_ok=True)
+        self.parts = len(part_files(directory))
+        self.rows = 0
+        self._reset()
+
+    def _reset(self):
+        self.buffer = {field.name: [] for field in RESULT_SCHEMA}
+        self.buffered_rows = 0
+        self.last_flush = time.monotonic()
+
+    def append(self, results, position):
+        """Add the forecast rows of one series (or a batch of series if ``position`` is an array)."""
+        for name in self.buffer:
+            if name == 'position':
+                values = np.broadcast_to(np.asarray(position, dtype=np.int32), len(results))
+            elif name not in results:
+                values = np.full(len(results), np.nan, dtype=np.float32)
+            else:
+                values = results[name].to_numpy()
+            self.buffer[name].append(values)
+        self.buffered_rows += len(results)
+        self.rows += len(results)
+        if (self.buffered_rows >= self.row_group_rows
+                or time.monotonic() - self.last_flush >= self.flush_seconds):
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows as a new part file."""
+        if not self.buffered_rows:
+            return
+        table = pa.table(
+            {name: pa.array(np.concatenate(chunks), type=RESULT_SCHEMA.field(name).type)
+             for name, chunks in self.buffer.items()},
+            schema=RESULT_SCHEMA,
+        )
+        path = os.path.join(self.directory, f'part-{self.parts:05d}.parquet')
+        pq.write_table(table, path + '.tmp', row_group_size=self.row_group_rows)
+        os.replace(path + '.tmp', path)
+        self.parts += 1
+        self._reset()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def part_files(directory=RESULTS_DIR):
+    """The complete part files of a results directory, in write order."""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith('part-') and name.endswith('.parquet')
+    )
+
+
+def completed_positions(directory=RESULTS_DIR):
+    """Positions of the series whose forecasts are already in a part file."""
+    files = part_files(directory)
+    if not files:
+        return set()
+    positions = ds.dataset(files, schema=RESULT_SCHEMA, format='parquet').to_table(columns=['position'])
+    return set(np.unique(positions['position'].to_numpy()).tolist())
+
+
+def clear_results(directory=RESULTS_DIR):
+    """Remove the part files of a previous run."""
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def read_results(directory=RESULTS_DIR):
+    """Read every part written so far, in series order."""
+    files = part_files(directory)
+    if not files:
+        return RESULT_SCHEMA.empty_table().to_pandas()
+    results = ds.dataset(files, schema=RESULT_SCHEMA, format='parquet').to_table().to_pandas()
+    # The sort is stable so each series keeps its date order
+    return results.sort_values('position', kind='stable').reset_index(drop=True)
@@ -1,169 +1,388 @@
 #!/usr/bin/env python3
-import pandas as pd
+import argparse
+import json
 import numpy as np
-from prophet import Prophet
-from sklearn.metrics import mean_absolute_error
-from sklearn.model_selection import ParameterGrid
+import pandas as pd
 import os
+import time
 import warnings
+from sales_store import read_sales_data
+from forecast.parallel import default_workers, make_pool, ordered_imap
+from forecast.series import series_bounds, series_panel
+from forecast.fast_engines import FAST_LOOKBACK_DAYS, select_engines
+from forecast.global_model import global_forecast, global_inputs
+from forecast.fingerprints import (
+    FINGERPRINT_FILE, load_fingerprints, save_fingerprints, series_fingerprint, series_key,
+)
+from forecast.model_store import MAX_STORE_MB, ModelStore
+from forecast.prophet_engine import forecast_series_safe, init_worker
+from forecast.regressors import RegressorTable
+from forecast.writer import ResultWriter, completed_positions, read_results
+from forecast.checkpoint import RUN_DIR, finish_run, publish_csv, run_signature, start_run
+from forecast.sharding import (
+    merge_fingerprints, merge_shards, parse_shard, shard_fingerprint_file, shard_mask, shard_name, write_shard,
+)
+from forecast.intervals import INTERVAL_MODES, analytic_bounds, weekly_residual_sigma
+from forecast.tuning import load_grid, load_tuned_params, params_for, tune
+from forecast.telemetry import RunReport, print_slowest
+from forecast.hierarchy import (
+    AGGREGATE_FILE, HIERARCHY_FINGERPRINT_FILE, aggregate_history, reconcile_hierarchy,
+)
 
 warnings.filterwarnings('ignore')
 
-# Check if the new_records flag indicates no new records
-with open('data/status.txt', 'r') as status_file:
-    new_records = int(status_file.read().strip().split('=')[1])
+forecast_periods = 7
 
-if new_records == 0:
-    print("No new records found. Loading existing forecast results.")
-    forecast_results = pd.read_csv('data/forecasting_results_8_to_8.csv')
-    print(forecast_results.head())
-else:
-    print('Model training')
-    # Load the latest parquet file
+results_file = 'data/new_results.csv'
+result_columns = ['date', 'prediction', 'item_name', 'branch', 'item_group']
+# Reconciled branch×item_group and item_group forecasts of a --hierarchy run
+groups_file = 'data/new_results_groups.csv'
+group_columns = ['date', 'prediction', 'branch', 'item_group']
+
+remove_branch = ['hayatabad', 'Victoria Saddar', 'Canal Road', 'Peshawar Cantt']
+
+items_to_remove = [
+    "Chocolate Dreamcake ", 
+    "Milk Chocolate",
+    "Nutella",
+    "Chunky Blend",
+    "Apple Cup Pie",
+    "White Chocolate ", 
+    "Carrot and Cheese (Cup Cakes)",
+    "All Chocolate Dreamcake -2.5 LBS",
+    "Chocolate Chunk Cookie",
+    "Mango Cheese Cake",
+    "Blueberry Muffin",
+    "Strawberry Donut",
+    "Kit Kat Donut",
+    "Cotton Candy Donut",
+    "Matcha (Cup Cakes)",
+    "Peanut Butter (Cup Cakes)",
+    "Matilda Brownie",
+    "Carrot Nut 2.5 LBS",
+    'Malteser 2.5 LBS',
+    'Nut Fusion 2.5 LBS',
+    "KitKat 2.5 LBS (Cup Cakes)",
+    "Peanut Butter (Cup Cakes)",
+    "Matilda Brownie",
+    "Carrot Nut 2.5 LBS",
+    'Malteser 2.5 LBS',
+    'Nut Fusion 2.5 LBS',
+    'KitKat 2.5 LBS'
+]
+
+dates_to_remove = [
+    '2023-11-09', '2023-12-24', '2023-12-25', '2023-12-26', '2023-12-31', 
+    '2024-01-01', '2024-02-08', '2024-02-14', '2024-02-26', '2024-03-23', 
+    '2024-04-09', '2024-04-10', '2024-04-11', '2024-04-12', '2024-04-13', 
+    '2024-05-01', '2024-05-11', '2024-05-12', '2024-06-17', '2024-06-18', 
+    '2024-06-19', '2024-07-16', '2024-07-17'
+]
+
+
+def load_history():
+    """Load the sales history and drop the excluded branches, items and dates."""
+    # Load the latest sales dataset
     with open('data/latest_forecasting_file.txt', 'r') as f:
-        parquet_file = f.read().strip()
-        df = pd.read_parquet(parquet_file)
+        sales_path = f.read().strip()
+        df = read_sales_data(sales_path)
 
     df['temperature_2m_max'] = df['temperature_2m_max'].fillna(df['temperature_2m_max'].mean()) 
     df['temperature_2m_min'] = df['temperature_2m_min'].fillna(df['temperature_2m_min'].mean()) 
-    # Preprocess the data
-    df['date'] = pd.to_datetime(df['date'])
+    # Preprocess the data ('date' is already datetime64 in the stored schema)
     df['day'] = df['date'].dt.day  # Extract the 'day' feature from the date
-    remove_branch = ['hayatabad', 'Victoria Saddar', 'Canal Road', 'Peshawar Cantt']
     df = df[~df['branch'].isin(remove_branch)]
     print(df['date'].max())
-    items_to_remove = [
-        "Chocolate Dreamcake ", 
-        "Milk Chocolate",
-        "Nutella",
-        "Chunky Blend",
-        "Apple Cup Pie",
-        "White Chocolate ", 
-        "Carrot and Cheese (Cup Cakes)",
-        "All Chocolate Dreamcake -2.5 LBS",
-        "Chocolate Chunk Cookie",
-        "Mango Cheese Cake",
-        "Blueberry Muffin",
-        "Strawberry Donut",
-        "Kit Kat Donut",
-        "Cotton Candy Donut",
-        "Matcha (Cup Cakes)",
-        "Peanut Butter (Cup Cakes)",
-        "Matilda Brownie",
-        "Carrot Nut 2.5 LBS",
-        'Malteser 2.5 LBS',
-        'Nut Fusion 2.5 LBS',
-        "KitKat 2.5 LBS (Cup Cakes)",
-        "Peanut Butter (Cup Cakes)",
-        "Matilda Brownie",
-        "Carrot Nut 2.5 LBS",
-        'Malteser 2.5 LBS',
-        'Nut Fusion 2.5 LBS',
-        'KitKat 2.5 LBS'
-    ] 
     df = df[~df['item_name'].isin(items_to_remove)]
-    
-    dates_to_remove = [
-        '2023-11-09', '2023-12-24', '2023-12-25', '2023-12-26', '2023-12-31', 
-        '2024-01-01', '2024-02-08', '2024-02-14', '2024-02-26', '2024-03-23', 
-        '2024-04-09', '2024-04-10', '2024-04-11', '2024-04-12', '2024-04-13', 
-        '2024-05-01', '2024-05-11', '2024-05-12', '2024-06-17', '2024-06-18', 
-        '2024-06-19', '2024-07-16', '2024-07-17'
-    ]
-    dates_to_remove = pd.to_datetime(dates_to_remove) 
-    df = df[~df['date'].isin(dates_to_remove)]
-
-    forecast_periods = 7
-    all_forecast_results = pd.DataFrame()
-    
-    # Loop through each combination of warehouse and category
-    best_mae = float('inf')
-    best_params = None
-    for warehouse in df['branch'].unique():
-        print(f"Processing warehouse: {warehouse}")
-        for category in df['item_name'].unique():
-            print(f"Processing category: {category} of {warehouse}")
-            category_df = df[(df['item_name'] == category) & (df['branch'] == warehouse)]
-            if len(category_df) <= forecast_periods:
-                continue
-
-            train = category_df.set_index('date')[:-forecast_periods]
-            test = category_df.set_index('date')[-forecast_periods:]
-            train = train.drop_duplicates()
-
-            if train['qty_sold'].dropna().shape[0] < 2:
-                print(f"Skipping category '{category}' due to insufficient data.")
-                continue
-
-           
-            
-            # Calculate the cap as the mode of qty_sold
-            cap_value = train['qty_sold'].mode().iloc[0]
-            
-            # Initialize the Prophet model with logistic growth
-            prophet_model = Prophet(seasonality_mode='additive', growth='logistic')
-            prophet_model.add_seasonality(name='weakly', period=7.0, fourier_order=3)
-            prophet_model.add_country_holidays(country_name='PK')
-            
-            # Add regressors
-            prophet_model.add_regressor('is_weekend')
-            prophet_model.add_regressor('temperature_2m_max')
-            prophet_model.add_regressor('temperature_2m_min')
-            prophet_model.add_regressor('day')
-
-            # Prepare data for Prophet with logistic growth cap
-            train = train.reset_index().rename(columns={'date': 'ds', 'qty_sold': 'y'})
-            train['cap'] = cap_value
-             # Include floor value during training
-
-            # Fit the model
-            prophet_model.fit(train)
-
-            # Create future DataFrame for prediction, including the forecast_periods
-            future = prophet_model.make_future_dataframe(periods=forecast_periods)
-            future = future.set_index('ds')
-
-            # Set cap and floor for future DataFrame and merge with regressors
-            future['cap'] = cap_value
-            
-            future = future.merge(df[['is_weekend', 'temperature_2m_max', 'temperature_2m_min', 'day']],
-                                how='left', left_index=True, right_index=True)
-            future = future.reset_index()
-
-            # Fill missing regressor values
-            future['is_weekend'].fillna(0, inplace=True)
-            historical_mean_temp_max = df['temperature_2m_max'].mean()
-            historical_mean_temp_min = df['temperature_2m_min'].mean()
-            future['temperature_2m_max'].fillna(historical_mean_temp_max, inplace=True)
-            future['temperature_2m_min'].fillna(historical_mean_temp_min, inplace=True)
-            future['day'] = future['day'].fillna(method='ffill')
-            if future['day'].isna().sum() > 0:
-                future['day'] = future['day'].fillna(pd.Series((future.index % 31) + 1, index=future.index))
-
-            # Make predictions
-            prophet_forecast = prophet_model.predict(future)
-
-            # Extract forecasted values and the uncertainty intervals
-            forecasted_values = prophet_forecast['yhat'][-forecast_periods:]
-
-
-            # Create the results DataFrame without the floor value
-            results = pd.DataFrame({
-                'date': pd.date_range(start=category_df['date'].max() + pd.Timedelta(days=1), periods=forecast_periods, freq='1D'),
-                'prediction': np.round(abs(forecasted_values)).astype(int),
-                'item_name': category,
-                'branch': warehouse,
-                'item_group': category_df['item_group'].iloc[0]
-            })
-
-            # Concatenate the results
-            all_forecast_results = pd.concat([all_forecast_results, results], ignore_index=True)
-            print(all_forecast_results.tail(7))
-    # Save results
-    csv_file = 'data/new_results.csv'
-    if os.path.exists(csv_file):
-        os.remove(csv_file)
-        print(f"Removed old file: {csv_file}")
-    all_forecast_results.to_csv(csv_file, index=False)
-
-    print("Forecasting completed and results saved.")
\ No newline at end of file
+    df = df[~df['date'].isin(pd.to_datetime(dates_to_remove))]
+    return df
+
+
+def iter_series(sorted_df, starts, stops):
+    """Yield the history of each given series of the sorted frame, printing progress."""
+    current_warehouse = None
+    for start, stop in zip(starts, stops):
+        category_df = sorted_df.iloc[start:stop]
+        warehouse, category = category_df['branch'].iloc[0], category_df['item_name'].iloc[0]
+        if warehouse != current_warehouse:
+            print(f"Processing warehouse: {warehouse}")
+            current_warehouse = warehouse
+        print(f"Processing category: {category} of {warehouse}")
+        yield category_df
+
+
+def fast_results(sorted_df, starts, last_dates, forecasts, sigma=None):
+    """Forecast rows of the fast-tier series, built for all of them at once.
+
+    With a per-series noise level ``sigma`` the rows get analytic ``lower``/``upper`` bounds.
+    """
+    periods = forecasts.shape[1]
+    first_rows = sorted_df.iloc[starts]
+    results = pd.DataFrame({
+        'date': (last_dates[:, None] + np.arange(1, periods + 1)).ravel().astype('datetime64[ns]'),
+        'prediction': np.round(np.clip(forecasts, 0, None)).astype(int).ravel(),
+        'item_name': first_rows['item_name'].to_numpy().repeat(periods),
+        'branch': first_rows['branch'].to_numpy().repeat(periods),
+        'item_group': first_rows['item_group'].to_numpy().repeat(periods),
+    })
+    if sigma is not None:
+        lower, upper = analytic_bounds(forecasts, sigma)
+        results['lower'] = np.round(lower).ravel()
+        results['upper'] = np.round(upper).ravel()
+    return results
+
+
+def load_previous_results(path=results_file):
+    """Load the last published forecasts, grouped by series key."""
+    if not os.path.exists(path):
+        return {}
+    previous = pd.read_csv(path, parse_dates=['date'])
+    return {
+        series_key(warehouse, category): rows
+        for (warehouse, category), rows in previous.groupby(['branch', 'item_name'], sort=False)
+    }
+
+
+def run_forecasts(df, writer, workers, max_tasks_per_child, engine='auto', force=False, model_store=None,
+                  tune_level=None, grid=None, retune=False, intervals='off', shard=None, report=None,
+                  fingerprint_file=FINGERPRINT_FILE, previous_file=results_file):
+    """Forecast every series with the fast tier, the global model or Prophet, as chosen by ``engine``.
+
+    The fast tier and the global model forecast all series in one batch. Of the Prophet
+    series, only those whose data changed since the last run are refitted; the other
+    forecasts are reused: their fingerprints are compared with ``fingerprint_file`` and
+    their forecasts taken from ``previous_file``.
+
+    With ``tune_level`` the Prophet parameters are searched first for the series (or
+    item groups) without cached winners; every Prophet series then uses its cached
+    winner, if any.
+
+    ``intervals`` selects the prediction bounds (see ``INTERVAL_MODES``); the batch
+    engines always use analytic bounds, as they have no posterior to sample.
+
+    With ``shard`` (``(i, n)``) only the series hashed to shard ``i`` of ``n`` are
+    forecast. Positions still count all series, so shards merge back in series order.
+
+    Forecasts are appended to ``writer`` as they come in, tagged with the series'
+    position. Series already in the writer's parts (a resumed run) are skipped. Every
+    series of the run gets a telemetry record in ``report``. Returns the fingerprints
+    of the Prophet series and the number of series to forecast.
+    """
+    report = RunReport() if report is None else report
+    # Too-short series are dropped here so they are never forecast at all
+    sorted_df, starts, stops = series_bounds(df)
+    long_enough = stops - starts > forecast_periods
+    starts, stops = starts[long_enough], stops[long_enough]
+
+    panel, last_dates = series_panel(sorted_df, starts, stops, FAST_LOOKBACK_DAYS)
+    batch_start = time.perf_counter()
+    if engine == 'global':
+        temperatures, codes = global_inputs(sorted_df, starts, stops, FAST_LOOKBACK_DAYS)
+        forecasts = global_forecast(panel, temperatures, codes, last_dates, forecast_periods)
+        models = np.full(len(starts), 'global')
+        use_prophet = np.zeros(len(starts), dtype=bool)
+    else:
+        models, forecasts, use_prophet = select_engines(panel, stops - starts, forecast_periods, engine)
+    # The batch engines fit every series at once; each is charged an equal share
+    batch_seconds = (time.perf_counter() - batch_start) / max(len(starts), 1)
+    fast = ~use_prophet
+    if shard is not None:
+        first_rows = sorted_df.iloc[starts]
+        in_shard = shard_mask(first_rows['branch'], first_rows['item_name'], *shard)
+        fast &= in_shard
+        use_prophet &= in_shard
+        print(f"Shard {shard[0]}/{shard[1]}: {in_shard.sum()} of {len(starts)} series")
+    series_count = int(fast.sum() + use_prophet.sum())
+    print(f"Batch engines: {fast.sum()} series ({pd.Series(models[fast]).value_counts().to_dict()}), "
+          f"Prophet: {use_prophet.sum()} series")
+    done = completed_positions(writer.directory)
+    if done:
+        print(f"Resuming: {len(done)} series already forecast")
+    resumed = (fast | use_prophet) & np.isin(np.arange(len(starts)), list(done))
+    report.add_batch(sorted_df.iloc[starts[resumed]], np.flatnonzero(resumed),
+                     np.where(use_prophet, 'prophet', models)[resumed], (stops - starts)[resumed],
+                     skip_reason='resumed')
+    fast &= ~resumed
+    sigma = weekly_residual_sigma(panel[fast]) if intervals != 'off' else None
+    fast_df = fast_results(sorted_df, starts[fast], last_dates[fast], forecasts[fast], sigma)
+    writer.append(fast_df, np.flatnonzero(fast).repeat(forecast_periods))
+    # Their training rows are the observed days of the lookback window
+    report.add_batch(sorted_df.iloc[starts[fast]], np.flatnonzero(fast), models[fast],
+                     np.isfinite(panel[fast]).sum(axis=1), batch_seconds)
+
+    prophet_positions = np.flatnonzero(use_prophet)
+    prophet_series = list(iter_series(sorted_df, starts[use_prophet], stops[use_prophet]))
+    regressor_table = RegressorTable(df, forecast_periods) if prophet_series else None
+    if tune_level is not None and prophet_series:
+        tuned = tune(prophet_series, tune_level, grid, regressor_table, forecast_periods,
+                     workers, max_tasks_per_child, retune)
+    else:
+        tuned = load_tuned_params()
+
+    previous_fingerprints = {} if force else load_fingerprints(fingerprint_file)
+    previous_results = {} if force else load_previous_results(previous_file)
+
+    fingerprints = {}
+    series_params = {}
+    reused = 0
+    to_fit = []
+    for position, category_df in zip(prophet_positions, prophet_series):
+        branch, item_name = category_df['branch'].iloc[0], category_df['item_name'].iloc[0]
+        key = series_key(branch, item_name)
+        series_params[key] = params_for(tuned, branch, item_name, category_df['item_group'].iloc[0])
+        # The parameters are part of the fingerprint, so a new tuning result means a refit
+        config = f'prophet-v2|periods={forecast_periods}|intervals={intervals}|{json.dumps(series_params[key], sort_keys=True)}'
+        fingerprints[key] = series_fingerprint(category_df, config)
+        if position in done:
+            continue
+        if previous_fingerprints.get(key) == fingerprints[key] and key in previous_results:
+            writer.append(previous_results[key], position)
+            report.add_batch(category_df.iloc[:1], [position], ['prophet'], [len(category_df)], skip_reason='unchanged')
+            reused += 1
+        else:
+            to_fit.append((position, category_df))
+    print(f"Refitting {len(to_fit)} changed series, reusing {reused} stored forecasts")
+
+    if to_fit:
+        initargs = (regressor_table, model_store, series_params, intervals)
+        with make_pool(workers, init_worker, initargs, max_tasks_per_child) as pool:
+            series_dfs = (category_df for _, category_df in to_fit)
+            for (position, category_df), (results, record) in zip(
+                    to_fit, ordered_imap(pool, forecast_series_safe, series_dfs, window=2 * workers)):
+                record.update(position=position, branch=category_df['branch'].iloc[0],
+                              item_name=category_df['item_name'].iloc[0], item_group=category_df['item_group'].iloc[0])
+                report.add(record)
+                if results is not None:
+                    writer.append(results, position)
+
+    if model_store is not None:
+        model_store.evict()
+
+    return fingerprints, series_count
+
+
+def output_table(results, columns=result_columns):
+    """The published columns of the results; bounds only if the run computed them."""
+    if results['lower'].notna().any():
+        results = results[columns + ['lower', 'upper']].copy()
+        results[['lower', 'upper']] = results[['lower', 'upper']].astype(int)
+        return results
+    return results[columns]
+
+
+def merge(shards):
+    """Assemble the outputs of all shards into the published forecast file."""
+    try:
+        merged = merge_shards(shards, forecast_periods)
+    except ValueError as err:
+        raise SystemExit(str(err))
+    publish_csv(output_table(merged), results_file)
+    save_fingerprints(merge_fingerprints(shards))
+    print(f"Merged {shards} shards ({merged[['branch', 'item_name']].drop_duplicates().shape[0]} series) into {results_file}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Fit one forecasting model per (branch, item) series.')
+    parser.add_argument('--workers', type=int, default=default_workers(),
+                        help='number of worker processes (default: all cores but one)')
+    parser.add_argument('--max-tasks-per-child', type=int, default=50,
+                        help='series a worker fits before it is replaced, to bound its memory')
+    parser.add_argument('--engine', choices=['auto', 'prophet', 'fast', 'global'], default='auto',
+                        help='auto: Prophet only for long, high-volume series the fast tier fits '
+                             'poorly; prophet/fast: every series to that tier; global: one '
+                             'gradient-boosted model over all series')
+    parser.add_argument('--force', action='store_true',
+                        help='refit every series, even those whose data did not change')
+    parser.add_argument('--tune', choices=['series', 'item_group'],
+                        help='search the Prophet parameter grid per series or per item group '
+                             'before forecasting; cached winners are reused')
+    parser.add_argument('--tune-grid', help='JSON file with the grid to search (default: PARAM_GRID)')
+    parser.add_argument('--retune', action='store_true',
+                        help='with --tune, search again even where a cached winner exists')
+    parser.add_argument('--intervals', choices=INTERVAL_MODES, default='off',
+                        help='prediction bounds: off (point forecasts only), analytic '
+                             '(residual-based, cheap) or sample (Prophet posterior simulation, slow)')
+    parser.add_argument('--no-resume', action='store_true',
+                        help='start afresh instead of resuming an interrupted run')
+    parser.add_argument('--shard', type=parse_shard, metavar='I/N',
+                        help='forecast only shard I of N (0 <= I < N, series assigned by a stable '
+                             'hash) and write a partial output for --merge')
+    parser.add_argument('--merge', type=int, metavar='N',
+                        help='merge and validate the outputs of shards 0..N-1, publish them and exit')
+    parser.add_argument('--model-store-mb', type=int, default=MAX_STORE_MB,
+                        help='size budget of the fitted-model store; 0 disables the store')
+    parser.add_argument('--hierarchy', action='store_true',
+                        help='forecast the branch×item_group and item_group totals instead of every '
+                             'item, reconcile them and split them among the items by their recent '
+                             f'sales; the reconciled totals go to {groups_file}')
+    args = parser.parse_args()
+    if args.hierarchy and (args.shard is not None or args.merge):
+        parser.error('--hierarchy cannot be combined with --shard or --merge')
+    # Each shard would tune an item group on its own members and overwrite the others' winner
+    if args.tune == 'item_group' and args.shard is not None:
+        parser.error('--tune item_group cannot be combined with --shard; tune in an unsharded run first')
+    return args
+
+
+def main():
+    args = parse_args()
+    if args.merge:
+        merge(args.merge)
+        return
+
+    print('Model training')
+    df = load_history()
+    # In hierarchical mode the engines forecast the aggregates, which are then reconciled
+    # and split among the items
+    history = aggregate_history(df) if args.hierarchy else df
+    model_store = ModelStore(max_mb=args.model_store_mb) if args.model_store_mb > 0 else None
+    # Results stream to Parquet parts in the run directory, readable while the run goes
+    # on. They double as checkpoints: an interrupted run with the same inputs and
+    # settings picks up from the series it had finished. Each shard has its own.
+    settings = {'engine': args.engine, 'periods': forecast_periods, 'force': args.force,
+                'tune': args.tune, 'tune_grid': args.tune_grid, 'intervals': args.intervals,
+                'hierarchy': args.hierarchy}
+    signature = run_signature(df, settings)
+    if args.hierarchy:
+        run_dir = os.path.join(RUN_DIR, 'hierarchy')
+    else:
+        run_dir = RUN_DIR if args.shard is None else os.path.join(RUN_DIR, shard_name(*args.shard))
+    fingerprint_file = HIERARCHY_FINGERPRINT_FILE if args.hierarchy else FINGERPRINT_FILE
+    results_dir = os.path.join(run_dir, 'results')
+    manifest_file = os.path.join(run_dir, 'manifest.json')
+    start_run(signature, resume=not args.no_resume, path=manifest_file, results_dir=results_dir)
+    report = RunReport()
+    with ResultWriter(results_dir) as writer:
+        fingerprints, series_count = run_forecasts(
+            history, writer, args.workers, args.max_tasks_per_child, args.engine, args.force, model_store,
+            args.tune, load_grid(args.tune_grid), args.retune, args.intervals, args.shard, report,
+            fingerprint_file, AGGREGATE_FILE if args.hierarchy else results_file,
+        )
+    all_forecast_results = read_results(results_dir)
+
+    if args.hierarchy:
+        aggregates, items = reconcile_hierarchy(df, all_forecast_results, forecast_periods)
+        publish_csv(output_table(items), results_file)
+        publish_csv(output_table(aggregates, group_columns), groups_file)
+        # The unreconciled forecasts are what the next run reuses for unchanged aggregates
+        publish_csv(output_table(all_forecast_results), AGGREGATE_FILE)
+        save_fingerprints(fingerprints, fingerprint_file)
+        print(f"Reconciled {series_count} aggregate forecasts into {items['position'].nunique()} items")
+    elif args.shard is None:
+        # Save results; the old file stays in place until the new one replaces it
+        publish_csv(output_table(all_forecast_results), results_file)
+        # Fingerprints are saved only once the forecasts they describe are on disk
+        save_fingerprints(fingerprints)
+    else:
+        write_shard(all_forecast_results, *args.shard, signature, series_count)
+        save_fingerprints(fingerprints, shard_fingerprint_file(*args.shard))
+    finish_run(manifest_file)
+    # Per-series fit times, rows and memory, to find the series that make the run slow
+    report_dir = os.path.join(run_dir, 'report')
+    print_slowest(report.write(report_dir))
+
+    print(f"Forecasting completed and results saved; run report in {report_dir}.")
+
+
+if __name__ == '__main__':
+    main()
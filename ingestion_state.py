@@ -0,0 +1,47 @@
+import os
+import json
+import pandas as pd
+
+# Persisted between hourly runs: the high-water marks on `tabPOS Invoice Item`
+# and a few statistics about the last run.
+INGESTION_STATE_FILE = 'data/ingestion_state.json'
+
+
+def empty_ingestion_state():
+    """Return the state used before the first successful run."""
+    return {
+        'high_water_mark': {'creation': None, 'modified': None},
+        'last_run': None,
+    }
+
+
+def load_ingestion_state(path=INGESTION_STATE_FILE):
+    """Load the ingestion state, or an empty state if none has been saved yet."""
+    if not os.path.exists(path):
+        return empty_ingestion_state()
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_ingestion_state(state, path=INGESTION_STATE_FILE):
+    """Write the ingestion state atomically so a crash never leaves a half-written file."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=4, default=str)
+    os.replace(tmp_path, path)
+
+
+def advance_high_water_mark(state, max_creation, max_modified):
+    """Move the high-water marks forward, never backwards.
+
+    The marks are the exact maxima seen; the query that reads from them reaches back
+    a safety lag (see data_ingestion_pipeline.py) for rows that commit late.
+    """
+    marks = state['high_water_mark']
+    for column, value in (('creation', max_creation), ('modified', max_modified)):
+        if value is None or pd.isna(value):
+            continue
+        value = pd.Timestamp(value)
+        if marks.get(column) is None or value > pd.Timestamp(marks[column]):
+            marks[column] = str(value)
+    return state
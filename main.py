@@ -24,9 +24,8 @@ def main():
     ])
 
     forecasting_df, sales_df,forecasting_all = load_data()
-        # Ensure the 'date' column is in datetime format
+        # Ensure the 'date' column is in datetime format (sales data is already typed by the store)
     forecasting_df['date'] = pd.to_datetime(forecasting_df['date'], errors='coerce')
-    sales_df['date'] = pd.to_datetime(sales_df['date'], errors='coerce')
 
     if selected_tab == "Chat with me":
         # Hide the "Layers Forecasting" title
@@ -22,6 +22,7 @@ import streamlit as st
 from google.oauth2 import service_account
 from googleapiclient import discovery
 import os
+from sales_store import read_sales_data
 load_dotenv()
 
 api_key = os.getenv('GROQ_API_KEY')
@@ -285,9 +286,10 @@ class ModelHandler:
         with open('data/latest_price_file.txt', 'r') as f:
             price_file = f.read().strip()
 
-        # Load and process sales and balance data
-        file_paths = [sales_file, balance_file, price_file]
-        sales_df, balance_df, price_df = self.load_and_process_data(file_paths)
+        # Load and process sales and balance data; the sales history is a partitioned dataset
+        sales_df = read_sales_data(sales_file)
+        file_paths = [balance_file, price_file]
+        balance_df, price_df = self.load_and_process_data(file_paths)
 
         col = ['item_name', 'price_list_rate', 'currency']
         price_df = price_df[col]
@@ -1,11 +1,23 @@
 import pandas as pd
+import numpy as np
 import json
-import requests
-from sklearn.preprocessing import LabelEncoder
+import calendar
+from weather import WeatherCache
+from sales_store import apply_sales_schema
+from instrumentation import StageRecorder
+
+# Fixed codes for the 'day' column: the alphabetical order LabelEncoder gives when all
+# seven days are present. A fixed table keeps the codes stable when only a slice of the
+# history is preprocessed, where some days may be missing.
+DAY_CODES = {name: code for code, name in enumerate(sorted(calendar.day_name))}
+
+# Attributes attached to every row from data/branch_info.json
+BRANCH_COLUMNS = ['city', 'latitude', 'longitude']
 
 class DataPreprocessor:
     def __init__(self, branch_mapping_file='data/simplified_branch_mapping.json', 
-                 branch_info_file='data/branch_info.json'):
+                 branch_info_file='data/branch_info.json', temperature_stats=None, weather_cache=None,
+                 recorder=None):
         # Load JSON files once to avoid redundant I/O
         with open(branch_mapping_file, 'r') as f:
             self.branch_mappings = json.load(f)
@@ -13,6 +25,27 @@ class DataPreprocessor:
         with open(branch_info_file, 'r') as f:
             self.branch_info = json.load(f)
 
+        # Branch dimension table, built once: one row per branch with its city and coordinates
+        self.branch_dim = pd.DataFrame.from_dict(self.branch_info, orient='index', columns=BRANCH_COLUMNS)
+        # Column arrays with a trailing null entry; get_indexer returns -1 for unknown branches,
+        # which picks that entry, so the lookup needs no masking
+        self.branch_columns = {
+            'city': np.append(self.branch_dim['city'].to_numpy(dtype=object), None),
+            'latitude': np.append(self.branch_dim['latitude'].to_numpy(dtype='float64'), np.nan),
+            'longitude': np.append(self.branch_dim['longitude'].to_numpy(dtype='float64'), np.nan),
+        }
+
+        # Per-day sum/count of observed temperatures, carried across runs so that missing
+        # values in a small slice are filled with the history mean, not the slice mean.
+        # Keyed by day so re-preprocessing a day replaces its entry instead of counting it twice.
+        self.temperature_stats = temperature_stats if temperature_stats is not None else {}
+
+        # Past temperatures never change, so they are kept on disk between runs
+        self.weather_cache = weather_cache if weather_cache is not None else WeatherCache()
+
+        # Per-stage timing and memory of every preprocess() call; written out by the caller
+        self.recorder = recorder if recorder is not None else StageRecorder('preprocess')
+
     def sort_by_date(self, df):
         """Sort the DataFrame by date in descending order."""
         if df is None:
@@ -54,99 +87,47 @@ class DataPreprocessor:
 
     def add_branch_info(self, df):
         """Add city, latitude, and longitude information based on branch mapping."""
-        df['city'] = df['branch'].map(lambda x: self.branch_info.get(x, {}).get('city'))
-        df['latitude'] = df['branch'].map(lambda x: self.branch_info.get(x, {}).get('latitude'))
-        df['longitude'] = df['branch'].map(lambda x: self.branch_info.get(x, {}).get('longitude'))
-        print(df.head())
+        # One hash lookup per row into the branch dimension, then a take per attribute
+        positions = self.branch_dim.index.get_indexer(df['branch'])
+        for col in BRANCH_COLUMNS:
+            df[col] = self.branch_columns[col][positions]
         return df
 
     def add_day_col(self, df):
-        df['date'] = pd.to_datetime(df['date'])
-
         df['day'] = df['date'].dt.day_name()
         return df
     
     def add_is_weekend_col(self, df):
         """Add a column to indicate whether the date falls on a weekend."""
-        df['date'] = pd.to_datetime(df['date'])
         df['is_weekend'] = df['date'].dt.dayofweek >= 5  # Saturday and Sunday are 5 and 6
         return df
 
     def add_temp_cols(self, df):
-        """Fetch temperature data for unique latitude and longitude pairs and add it to the DataFrame."""
-        # Convert the 'date' column to datetime
-        df['date'] = pd.to_datetime(df['date'])
-
-        # Step 2: Fetch unique dates from the sales data
-        unique_dates = df['date'].dt.strftime('%Y-%m-%d').tolist()
-
-        # Step 3: Get unique latitude and longitude pairs
+        """Add daily temperatures for each row's location, served from the local weather cache."""
+        # Only days missing from the cache are fetched from the archive API
         unique_locations = df[['latitude', 'longitude']].drop_duplicates()
+        temp_data = self.weather_cache.get(unique_locations, df['date'].min(), df['date'].max())
 
-        # Prepare a DataFrame to hold temperature data
-        temp_data = pd.DataFrame()
-
-        # Fetch temperature data for each unique location
-        for _, location in unique_locations.iterrows():
-            latitude = location['latitude']
-            longitude = location['longitude']
-
-            # Check if latitude and longitude are valid
-            if pd.isna(latitude) or pd.isna(longitude):
-                print(f"Skipping invalid location: {latitude}, {longitude}")
-                continue
-
-            start_date = min(unique_dates)
-            end_date = max(unique_dates)
-
-            url = f"https://archive-api.open-meteo.com/v1/archive?latitude={latitude}&longitude={longitude}&start_date={start_date}&end_date={end_date}&daily=temperature_2m_max,temperature_2m_min&timezone=Asia/Karachi"
-
-            # Fetch the temperature data
-            response = requests.get(url)
-            temperature_data = response.json()
-            print(f"Temperature data fetched for location: {latitude}, {longitude}")
-            print(f"Response: {temperature_data}")
-
-            if 'daily' not in temperature_data:
-                print(f"No daily temperature data for location: {latitude}, {longitude}")
-                continue  # Skip to the next location if no data is returned
-
-            # Create a DataFrame from the temperature data
-            temp_df = pd.DataFrame(temperature_data['daily'])
-
-            # Add latitude and longitude to the temperature DataFrame
-            temp_df['latitude'] = latitude
-            temp_df['longitude'] = longitude
-
-            # Rename 'time' to 'date' for merging
-            temp_df = temp_df.rename(columns={'time': 'date'})
-
-            # Convert 'date' in the temperature DataFrame to datetime
-            temp_df['date'] = pd.to_datetime(temp_df['date'])
-
-            # Append to the temp_data DataFrame
-            temp_data = pd.concat([temp_data, temp_df], ignore_index=True)
-
-        # Step 4: Drop duplicate temperature columns if they exist in the original DataFrame
+        # Drop duplicate temperature columns if they exist in the original DataFrame
         df = df.drop(columns=['temperature_2m_max', 'temperature_2m_min'], errors='ignore')
 
         # Merge the sales data with the temperature data using 'date' and location
         merged_data = pd.merge(df, temp_data, on=['date', 'latitude', 'longitude'], how='left')
 
-        # Print the merged DataFrame
-        print(merged_data)
-
         return merged_data
 
+    def warm_weather_cache(self, start_date, end_date):
+        """Fetch the temperatures of every known branch location between two dates into the cache."""
+        self.weather_cache.get(self.branch_dim[['latitude', 'longitude']], start_date, end_date)
+
     def remove_uncessary_cols(self, df):
         """Remove unnecessary columns."""
         df = df.drop(columns=['city',	'latitude'	,'longitude'])
         return df
 
     def encode_categorical_col(self, df):
-        """Encode categorical columns using one-hot encoding."""
-        encoder = LabelEncoder()
-        df['day'] = encoder.fit_transform(df['day'])
+        """Encode the day name as a fixed integer code."""
+        df['day'] = df['day'].map(DAY_CODES)
         return df
 
 
@@ -155,39 +136,48 @@ class DataPreprocessor:
         columns_to_fill = ['temperature_2m_max', 'temperature_2m_min']  # Specify the columns you want to fill with the mean
 
         for col in columns_to_fill:
-            # Fill NaN values in the specified column with the mean of that column
-            df[col] = df[col].fillna(df[col].mean())
+            # Record the observed values per day, then fill NaN values with the mean over all recorded days
+            observed = df[col].groupby(df['date'].dt.normalize()).agg(['sum', 'count'])
+            observed = observed[observed['count'] > 0]
+            daily_stats = self.temperature_stats.setdefault(col, {})
+            daily_stats.update({
+                f'{day:%Y-%m-%d}': [float(total), int(count)] for day, total, count in observed.itertuples()
+            })
+            total_count = sum(count for _, count in daily_stats.values())
+            if total_count:
+                df[col] = df[col].fillna(sum(total for total, _ in daily_stats.values()) / total_count)
 
         return df
+
     def preprocess(self, df):
         """Preprocess the DataFrame by applying all transformations."""
-        # Ensure 'date' column is in datetime format
+        # Convert 'date' once here; the individual steps rely on it being datetime
         df['date'] = pd.to_datetime(df['date'])
 
-        # Sort by date in descending order
-        df = self.sort_by_date(df)
-        # Replace branch names
-        df = self.replace_branch_names(df)
-        # group by and sum daily quantities
-        # df = self.group_by_and_sum_daily_quantities(df)
-
-
-        # Add a new column with the day of the week
-        df = self.add_day_col(df)
-
-        # add is weekend column
-        df = self.add_is_weekend_col(df)
-
-        # Process the data and add branch info
-        df = self.add_branch_info(df)
-
-        # Add temperature data
-        df =  self.add_temp_cols(df)
-        # remove unnessory cols 
-        df = self.remove_uncessary_cols(df)
-        # encode categorical colums
-        df = self.encode_categorical_col(df)
-
-        # fill null values
-        df = self.fill_null_values(df)
-        return df
\ No newline at end of file
+        # Every step runs through the recorder, which logs its time, rows and peak memory
+        stages = [
+            # Sort by date in ascending order
+            ('sort_by_date', self.sort_by_date),
+            # Replace branch names
+            ('replace_branch_names', self.replace_branch_names),
+            # Add a new column with the day of the week
+            ('add_day_col', self.add_day_col),
+            # add is weekend column
+            ('add_is_weekend_col', self.add_is_weekend_col),
+            # Process the data and add branch info
+            ('add_branch_info', self.add_branch_info),
+            # Add temperature data
+            ('add_temp_cols', self.add_temp_cols),
+            # remove unnessory cols
+            ('remove_uncessary_cols', self.remove_uncessary_cols),
+            # encode categorical colums
+            ('encode_categorical_col', self.encode_categorical_col),
+            # fill null values
+            ('fill_null_values', self.fill_null_values),
+            # Cast to the canonical sales types used by the store and all readers
+            ('apply_sales_schema', apply_sales_schema),
+        ]
+        for name, stage in stages:
+            df = self.recorder.run(name, stage, df)
+        self.recorder.next_batch()
+        return df
@@ -0,0 +1,170 @@
+import os
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+# Sales history is stored as a hive-partitioned dataset, one directory per day:
+#   data/actual_sales_data/date=YYYY-MM-DD/part-0.parquet
+# The 'date' column lives in the directory name only, so a run that touches a
+# couple of days rewrites a couple of small files instead of the whole history.
+SALES_DATASET = 'data/actual_sales_data'
+LEGACY_SALES_FILE = 'data/actual_sales_data.parquet'
+SALES_KEYS = ['date', 'item_name', 'branch']
+
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.date32())]), flavor='hive')
+
+# Canonical types of the stored history. Strings are dictionary encoded (categoricals in
+# pandas) and numbers use compact types; the files keep these types, so readers get them
+# back without any conversion. 'date' is the partition key and is read as datetime64[ns].
+_category = pa.dictionary(pa.int32(), pa.string())
+SALES_SCHEMA = pa.schema([
+    ('date', pa.date32()),
+    ('item_group', _category),
+    ('item_name', _category),
+    ('branch', _category),
+    ('qty_sold', pa.float32()),
+    ('day', pa.int8()),
+    ('is_weekend', pa.bool_()),
+    ('temperature_2m_max', pa.float32()),
+    ('temperature_2m_min', pa.float32()),
+])
+SALES_DTYPES = {
+    'item_group': 'category',
+    'item_name': 'category',
+    'branch': 'category',
+    'qty_sold': 'float32',
+    'day': 'int8',
+    'is_weekend': 'bool',
+    'temperature_2m_max': 'float32',
+    'temperature_2m_min': 'float32',
+}
+
+
+def apply_sales_schema(df):
+    """Return ``df`` with the canonical sales types; 'date' is converted only if it is not datetime yet."""
+    df = df.astype({col: dtype for col, dtype in SALES_DTYPES.items() if col in df.columns})
+    if 'date' in df.columns and not pd.api.types.is_datetime64_dtype(df['date']):
+        df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+def _to_table(df):
+    """Convert a sales DataFrame to an Arrow table with the canonical schema."""
+    schema = pa.schema([field for field in SALES_SCHEMA if field.name in df.columns])
+    return pa.Table.from_pandas(apply_sales_schema(df), schema=schema, preserve_index=False)
+
+
+def partition_dates(dataset=SALES_DATASET):
+    """Return the sorted partition dates of the dataset without reading any data."""
+    if not os.path.isdir(dataset):
+        return []
+    dates = [pd.Timestamp(name[len('date='):]) for name in os.listdir(dataset) if name.startswith('date=')]
+    return sorted(dates)
+
+
+def _date_filter(start_date=None, end_date=None, dates=None):
+    """Build a partition filter on the 'date' field."""
+    expression = None
+    conditions = []
+    if start_date is not None:
+        conditions.append(ds.field('date') >= pd.Timestamp(start_date).date())
+    if end_date is not None:
+        conditions.append(ds.field('date') <= pd.Timestamp(end_date).date())
+    if dates is not None:
+        conditions.append(ds.field('date').isin([pd.Timestamp(d).date() for d in dates]))
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def read_sales_data(path=SALES_DATASET, columns=None, start_date=None, end_date=None, dates=None):
+    """Read the sales history, optionally restricted to some columns and dates.
+
+    This is the single reader used by the ingestion job, ``forecasting.py`` and the
+    dashboard. ``path`` may point at the partitioned dataset or at a single Parquet
+    file; if the dataset does not exist yet the legacy single file is read instead.
+    """
+    if not os.path.isdir(path):
+        legacy_file = path if path.endswith('.parquet') else path + '.parquet'
+        df = apply_sales_schema(pd.read_parquet(legacy_file, columns=columns))
+        if 'date' in df.columns:
+            if start_date is not None:
+                df = df[df['date'] >= pd.Timestamp(start_date)]
+            if end_date is not None:
+                df = df[df['date'] <= pd.Timestamp(end_date)]
+            if dates is not None:
+                df = df[df['date'].isin(pd.to_datetime(dates))]
+        return df.reset_index(drop=True)
+
+    dataset = ds.dataset(path, format='parquet', partitioning=PARTITIONING)
+    table = dataset.to_table(columns=columns, filter=_date_filter(start_date, end_date, dates))
+    if 'date' in table.column_names:
+        # Partition fields come back last; keep 'date' as the first column like the old file
+        date_column = pc.cast(table['date'], pa.timestamp('ns'))
+        table = table.drop_columns(['date']).add_column(0, 'date', date_column)
+    return table.to_pandas()
+
+
+def write_partitions(df, dataset=SALES_DATASET):
+    """Write ``df`` to the dataset, replacing only the date partitions it contains."""
+    if df.empty:
+        return
+    table = _to_table(df)
+    ds.write_dataset(
+        table, dataset, format='parquet', partitioning=PARTITIONING,
+        basename_template='part-{i}.parquet', existing_data_behavior='delete_matching'
+    )
+    logging.info(f"Rewrote {pc.count_distinct(table['date']).as_py()} partition(s) in {dataset}")
+
+
+def upsert_partitions(df, dataset=SALES_DATASET, keys=SALES_KEYS):
+    """Merge ``df`` into the dataset by ``keys``; rows in ``df`` replace stored rows with the same key.
+
+    Only the partitions for the dates in ``df`` are read and rewritten.
+    """
+    if df.empty:
+        return
+    df = apply_sales_schema(df)
+    existing_df = read_sales_data(dataset, dates=df['date'].unique())
+    combined_df = pd.concat([existing_df, df]).drop_duplicates(subset=keys, keep='last')
+    write_partitions(combined_df, dataset)
+
+
+def sum_by_key(df, keys=SALES_KEYS):
+    """Add up the ``qty_sold`` of rows with the same key, keeping the other columns of the first.
+
+    Several warehouses map to one branch (e.g. two 'civil lines'), so after the branch
+    names are simplified their rows share a key and belong together.
+    """
+    other = {column: 'first' for column in df.columns if column not in keys and column != 'qty_sold'}
+    summed = df.groupby(keys, observed=True, sort=False, as_index=False).agg({**other, 'qty_sold': 'sum'})
+    return summed[list(df.columns)]
+
+
+def migrate_legacy_file(legacy_file=LEGACY_SALES_FILE, dataset=SALES_DATASET):
+    """Split the old single-file history into date partitions, once.
+
+    The old file holds some keys twice (overlapping ingestion runs); as in an upsert,
+    the later row wins.
+    """
+    if os.path.isdir(dataset) or not os.path.exists(legacy_file):
+        return
+    logging.info(f"Migrating {legacy_file} to partitioned dataset {dataset}")
+    write_partitions(pd.read_parquet(legacy_file).drop_duplicates(subset=SALES_KEYS, keep='last'), dataset)
+
+
+def append_partitions(df, dataset=SALES_DATASET, batch_id=0):
+    """Add ``df`` to the dataset as new files, leaving existing partition files in place.
+
+    Used when streaming the full history chunk by chunk: a day that straddles two
+    chunks simply ends up with one file per chunk in its partition directory.
+    """
+    if len(df) == 0:
+        return
+    table = _to_table(df)
+    ds.write_dataset(
+        table, dataset, format='parquet', partitioning=PARTITIONING,
+        basename_template=f'chunk-{batch_id}-{{i}}.parquet', existing_data_behavior='overwrite_or_ignore'
+    )
@@ -20,7 +20,7 @@ def display_overall_summary(sales_df):
     total_branches = len(sales_df['branch'].unique())
     st.markdown(f"#### Total Branches: {total_branches + 1}")
 
-    branch_totals = sales_df.groupby('branch')['qty_sold'].sum().reset_index()
+    branch_totals = sales_df.groupby('branch', observed=True)['qty_sold'].sum().reset_index()
     
     # Top 5 selling branches
     top_selling_branches = branch_totals.nlargest(5, 'qty_sold').reset_index(drop=True)
@@ -78,11 +78,11 @@ def weekly_analysis(filtered_sales_data):
         st.plotly_chart(weekly_sales_fig)
         
         st.markdown("#### Top 5 Selling Items")
-        top_items = weekly_data.groupby('item_name')['qty_sold'].sum().nlargest(5).reset_index()
+        top_items = weekly_data.groupby('item_name', observed=True)['qty_sold'].sum().nlargest(5).reset_index()
         st.table(top_items)
         
         st.markdown("#### Least 5 Selling Items")
-        least_items = weekly_data.groupby('item_name')['qty_sold'].sum().nsmallest(5).reset_index()
+        least_items = weekly_data.groupby('item_name', observed=True)['qty_sold'].sum().nsmallest(5).reset_index()
         st.table(least_items)
     else:
         st.info(f"No sales data available for the week of {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}.")
@@ -102,11 +102,11 @@ def monthly_analysis(filtered_sales_data):
         st.plotly_chart(monthly_sales_fig)
 
         st.markdown("#### Top 5 Selling Items in the Month")
-        top_monthly_items = monthly_data.groupby('item_name')['qty_sold'].sum().nlargest(5).reset_index()
+        top_monthly_items = monthly_data.groupby('item_name', observed=True)['qty_sold'].sum().nlargest(5).reset_index()
         st.table(top_monthly_items)
         
         st.markdown("#### Least 5 Selling Items in the Month")
-        least_monthly_items = monthly_data.groupby('item_name')['qty_sold'].sum().nsmallest(5).reset_index()
+        least_monthly_items = monthly_data.groupby('item_name', observed=True)['qty_sold'].sum().nsmallest(5).reset_index()
         st.table(least_monthly_items)
     else:
         st.info(f"No sales data available for {selected_date.strftime('%B %Y')}.")
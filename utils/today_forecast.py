@@ -8,6 +8,7 @@ from sqlalchemy import create_engine,text
 import os
 import dotenv
 import json
+from sales_store import read_sales_data
 warnings.filterwarnings("ignore")
 
 dotenv.load_dotenv()
@@ -36,7 +37,7 @@ yesterday = today - datetime.timedelta(days=1)
 def load_data_for_user():
     """Load data from CSV and Parquet files."""
     forecasting_df = pd.read_csv('data/new_results.csv')
-    sales_data = pd.read_parquet('data/actual_sales_data.parquet')
+    sales_data = read_sales_data()
     return forecasting_df, sales_data
 
 def remove_items(df):
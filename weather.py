@@ -0,0 +1,170 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+WEATHER_CACHE_FILE = 'data/weather_cache.parquet'
+# Point WEATHER_API_URL at a local stub server to run or benchmark the fetch layer offline
+ARCHIVE_URL = os.getenv('WEATHER_API_URL', 'https://archive-api.open-meteo.com/v1/archive')
+
+# Fetch layer settings: locations are requested concurrently over one pooled session
+MAX_WORKERS = 8
+REQUEST_TIMEOUT = (5, 30)  # (connect, read) seconds
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5  # sleeps 0.5s, 1s, 2s between retries
+
+TEMPERATURE_COLUMNS = ['temperature_2m_max', 'temperature_2m_min']
+CACHE_KEYS = ['latitude', 'longitude', 'date']
+# Days the archive has not published yet are asked for again only after this long
+UNAVAILABLE_TTL = pd.Timedelta(hours=12)
+
+
+def make_session(pool_size=MAX_WORKERS, retries=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR):
+    """Create a session that keeps connections alive and retries with exponential backoff."""
+    retry = Retry(
+        total=retries, backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504), allowed_methods=['GET'],
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def fetch_temperatures(latitude, longitude, start_date, end_date, session=None,
+                       base_url=ARCHIVE_URL, timeout=REQUEST_TIMEOUT):
+    """Fetch daily min/max temperatures for one location from the open-meteo archive."""
+    params = {
+        'latitude': latitude,
+        'longitude': longitude,
+        'start_date': pd.Timestamp(start_date).strftime('%Y-%m-%d'),
+        'end_date': pd.Timestamp(end_date).strftime('%Y-%m-%d'),
+        'daily': ','.join(TEMPERATURE_COLUMNS),
+        'timezone': 'Asia/Karachi',
+    }
+    session = session if session is not None else requests
+    try:
+        temperature_data = session.get(base_url, params=params, timeout=timeout).json()
+    except (requests.RequestException, ValueError) as err:
+        # Missing days are simply fetched again on the next run
+        logging.warning(f"Temperature request failed for location {latitude}, {longitude}: {err}")
+        return None
+    if 'daily' not in temperature_data:
+        logging.warning(f"No daily temperature data for location: {latitude}, {longitude}")
+        return None
+
+    temp_df = pd.DataFrame(temperature_data['daily']).rename(columns={'time': 'date'})
+    temp_df['date'] = pd.to_datetime(temp_df['date'])
+    temp_df['latitude'] = latitude
+    temp_df['longitude'] = longitude
+    return temp_df[CACHE_KEYS + TEMPERATURE_COLUMNS]
+
+
+def fetch_all_temperatures(ranges, base_url=ARCHIVE_URL, max_workers=MAX_WORKERS,
+                           timeout=REQUEST_TIMEOUT, retries=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR):
+    """Fetch (latitude, longitude, start, end) ranges concurrently and return one DataFrame."""
+    if not ranges:
+        return pd.DataFrame(columns=CACHE_KEYS + TEMPERATURE_COLUMNS)
+    with make_session(max_workers, retries, backoff_factor) as session, \
+            ThreadPoolExecutor(max_workers=max_workers) as pool:
+        frames = list(pool.map(
+            lambda weather_range: fetch_temperatures(*weather_range, session=session, base_url=base_url, timeout=timeout),
+            ranges,
+        ))
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        return pd.DataFrame(columns=CACHE_KEYS + TEMPERATURE_COLUMNS)
+    # A single concat at the end instead of growing a frame per location
+    return pd.concat(frames, ignore_index=True)
+
+
+class WeatherCache:
+    """On-disk cache of daily temperatures keyed by (latitude, longitude, date).
+
+    Past temperatures never change, so only days missing from the cache are fetched.
+    Days the archive has not published yet come back empty; they are cached as
+    unavailable rows (without temperatures) stamped with ``fetched_at``, and asked for
+    again only once that is ``UNAVAILABLE_TTL`` old. With ``offline=True`` nothing is
+    fetched at all.
+    """
+
+    def __init__(self, cache_file=WEATHER_CACHE_FILE, offline=False, base_url=ARCHIVE_URL, max_workers=MAX_WORKERS):
+        self.cache_file = cache_file
+        self.offline = offline
+        self.base_url = base_url
+        self.max_workers = max_workers
+        if os.path.exists(cache_file):
+            self.data = pd.read_parquet(cache_file)
+        else:
+            self.data = pd.DataFrame({
+                'latitude': pd.Series(dtype='float64'),
+                'longitude': pd.Series(dtype='float64'),
+                'date': pd.Series(dtype='datetime64[ns]'),
+                'temperature_2m_max': pd.Series(dtype='float64'),
+                'temperature_2m_min': pd.Series(dtype='float64'),
+            })
+        if 'fetched_at' not in self.data:
+            self.data['fetched_at'] = pd.Series(pd.NaT, index=self.data.index, dtype='datetime64[ns]')
+
+    def missing_ranges(self, locations, start_date, end_date, now=None):
+        """Return (latitude, longitude, start, end) spans covering the days not cached yet.
+
+        Days recently found unavailable count as cached until their entry expires.
+        """
+        now = pd.Timestamp.now() if now is None else now
+        wanted = pd.date_range(pd.Timestamp(start_date).normalize(), pd.Timestamp(end_date).normalize(), freq='D')
+        known = self.data[self.data['temperature_2m_max'].notna() | (self.data['fetched_at'] > now - UNAVAILABLE_TTL)]
+        cached = known.groupby(['latitude', 'longitude'])['date'].agg(set).to_dict()
+        ranges = []
+        for latitude, longitude in locations[['latitude', 'longitude']].itertuples(index=False):
+            missing = wanted.difference(pd.DatetimeIndex(list(cached.get((latitude, longitude), ()))))
+            if len(missing):
+                ranges.append((latitude, longitude, missing.min(), missing.max()))
+        return ranges
+
+    def update(self, fetched, ranges=(), now=None):
+        """Add fetched days to the cache and persist it.
+
+        Days of the requested ``ranges`` that came back incomplete, for the locations that
+        did answer, are stored as unavailable (temperatures dropped, ``fetched_at`` set).
+        """
+        now = pd.Timestamp.now() if now is None else now
+        new_rows = fetched.dropna(subset=TEMPERATURE_COLUMNS)
+        answered = set(fetched[['latitude', 'longitude']].itertuples(index=False, name=None))
+        requested = [
+            pd.DataFrame({'latitude': latitude, 'longitude': longitude, 'date': pd.date_range(start, end, freq='D')})
+            for latitude, longitude, start, end in ranges if (latitude, longitude) in answered
+        ]
+        if requested:
+            # Requested days without complete temperatures are kept as unavailable rows
+            new_rows = pd.concat(requested, ignore_index=True).merge(new_rows, on=CACHE_KEYS, how='left')
+        if new_rows.empty:
+            return
+        new_rows = new_rows.assign(fetched_at=pd.Timestamp(now).as_unit('ns'))
+        self.data = (
+            pd.concat([self.data, new_rows] if not self.data.empty else [new_rows], ignore_index=True)
+            .drop_duplicates(subset=CACHE_KEYS, keep='last')
+            .sort_values(CACHE_KEYS, ignore_index=True)
+        )
+        tmp_file = self.cache_file + '.tmp'
+        self.data.to_parquet(tmp_file, engine='pyarrow', index=False)
+        os.replace(tmp_file, self.cache_file)
+
+    def get(self, locations, start_date, end_date):
+        """Return the temperatures of ``locations`` between two dates, fetching only what is missing."""
+        locations = locations[['latitude', 'longitude']].dropna().drop_duplicates()
+        ranges = self.missing_ranges(locations, start_date, end_date)
+        if ranges and not self.offline:
+            logging.info(f"Fetching temperatures for {len(ranges)} location(s) not fully cached")
+            self.update(fetch_all_temperatures(ranges, base_url=self.base_url, max_workers=self.max_workers), ranges)
+
+        in_range = self.data['date'].between(pd.Timestamp(start_date).normalize(), pd.Timestamp(end_date))
+        in_locations = pd.MultiIndex.from_frame(self.data[['latitude', 'longitude']]).isin(
+            pd.MultiIndex.from_frame(locations)
+        )
+        available = self.data['temperature_2m_max'].notna()
+        return self.data.loc[in_range & in_locations & available, CACHE_KEYS + TEMPERATURE_COLUMNS].reset_index(drop=True)